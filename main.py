@@ -1,12 +1,40 @@
-import sys
+import sys, os, json, time, asyncio
 
-from src import scanner, parser, ast_printer, interpreter, repl
+from src import scanner, parser, parallel_parser, ast_printer, interpreter, repl, tasks
+from src.inliner import Inliner
+from src.type_inference import TypeInference
 from src.errors import report_error, NathRuntimeError, NathSyntaxError
+from src.budget import Budget
+from src.stats import Stats, StatsRecorder
+from src.notebook import Notebook
+
+# command line flags for the limits of a Budget, ie --max-steps=100000
+budget_flags = {'--max-steps': int, '--timeout': float, '--max-call-depth': int, '--max-sequence-length': int}
+# a script that starts with this line always runs like with --async, ie tests/tasks.nath
+ASYNC_DIRECTIVE = '# nath: async'
 
 class NathRuntime():
-    def __init__(self, in_repl=False):
+    def __init__(self, in_repl=False, collect_stats=False, show_stats=False, stats_log=None, use_async=False,
+                 parse_processes=1, **interpreter_options):
+        '''``collect_stats`` also counts what the interpreter does (calls, nodes, ...), without it
+           only the phases are timed and the interpreter is left as it is. ``show_stats`` prints them
+           after every run.
+           ``stats_log`` is a file that gets a json line with the stats of every run.
+           ``use_async`` runs scripts on an asyncio event loop, where they can spawn tasks.
+           ``parse_processes`` > 1 parses huge sources on a process pool'''
+        self.use_async = use_async
+        self.parse_processes = parse_processes
         self.parser = parser.Parser() 
-        self.interpreter = interpreter.Interpreter(in_repl=in_repl)
+        self.interpreter = interpreter.Interpreter(in_repl=in_repl, **interpreter_options)
+        self.recorder = StatsRecorder(self.interpreter) if collect_stats else None
+        self.show_stats = show_stats
+        self.stats_log = stats_log
+        self.totals = Stats()
+        self.runs = 0
+
+    def stats(self) -> dict:
+        '''Totals of all runs so far (maximums for peak_call_depth and largest_range)'''
+        return {'runs': self.runs, **self.totals.as_dict(counters=self.recorder is not None)}
 
     def run_file(self, filename):
         with open(filename) as f:
@@ -17,15 +45,35 @@ class NathRuntime():
                 sys.exit(opcode)
 
     def run(self, source):
+        stats = Stats()
+        if self.recorder is not None: self.recorder.stats = stats
+        opcode = self.run_phases(source, stats)
+        self.runs += 1
+        self.totals.add(stats)
+        if self.show_stats: print('stats:', stats.as_dict(counters=self.recorder is not None))
+        if self.stats_log is not None:
+            record = {'time': time.time(), 'exit_code': opcode, **stats.as_dict(counters=self.recorder is not None)}
+            self.stats_log.write(json.dumps(record) + '\n')
+            self.stats_log.flush()
+        return opcode
+
+    def run_phases(self, source, stats: Stats):
         try: ### scan
-            _scanner = scanner.Scanner(source)
-            tokens =  _scanner.scan_tokens()
+            t0 = time.perf_counter()
+            tokens = None # huge sources can be scanned and parsed in pieces on a process pool
+            if self.parse_processes == 1 or len(source) < parallel_parser.PARALLEL_THRESHOLD:
+                _scanner = scanner.Scanner(source)
+                tokens =  _scanner.scan_tokens()
             # print('tokens:', [t.type for t in tokens])
         except NathSyntaxError as e:
             report_error(e)
             return 65
+        finally: stats.scan_time = time.perf_counter() - t0
         try: ### parse
-            statements = self.parser.parse(tokens)
+            t0 = time.perf_counter()
+            if tokens is not None: statements = self.parser.parse(tokens)
+            else: statements = parallel_parser.parse(source, self.parse_processes)
+            stats.parse_time = time.perf_counter() - t0
             printer = ast_printer.AstPrinter()
             print("ast:")
             try:
@@ -35,23 +83,76 @@ class NathRuntime():
                 print("Can't print ast:", e)
             
         except NathSyntaxError as e:
+            stats.parse_time = time.perf_counter() - t0
             report_error(e)
             return 65
+        # the inliner and the type inference need the whole program, a repl line can be followed
+        # by one that redefines a function
+        if not self.interpreter.in_repl: 
+            t0 = time.perf_counter()
+            Inliner().inline(statements)
+            stats.checks_removed = TypeInference().infer(statements)
+            stats.parse_time += time.perf_counter() - t0
         try: ### interpret
             print('bindings:', self.interpreter.env.dict, '\n')
-            self.interpreter.interpret(statements)
+            t0 = time.perf_counter()
+            if self.use_async or source.startswith(ASYNC_DIRECTIVE):
+                asyncio.run(tasks.Runtime(self.interpreter).run(lambda: self.interpreter.interpret(statements)))
+            else: self.interpreter.interpret(statements)
         except NathRuntimeError as e:
             report_error(e)
             return 70
+        finally: stats.execute_time = time.perf_counter() - t0
         return 0
 
+def watch(filename, poll_interval=0.5, **interpreter_options):
+    '''Run a file, and after every change run the statements that changed and their dependents'''
+    notebook = Notebook(**interpreter_options)
+    last_modified = None
+    try:
+        while True:
+            modified = os.stat(filename).st_mtime
+            if modified != last_modified:
+                last_modified = modified
+                with open(filename) as f: source = f.read()
+                try:
+                    ran = notebook.update(source)
+                    print(f"### ran statements {ran}")
+                except (NathSyntaxError, NathRuntimeError) as e:
+                    report_error(e)
+            time.sleep(poll_interval)
+    except KeyboardInterrupt: pass
+
 def main():
-    if len(sys.argv) > 2:
-        print("Usage: python nath.py [path]")
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = {}
+    if '--jit-debug' in sys.argv: options['jit_debug'] = True # print the python code of compiled functions
+    if '--no-jit' in sys.argv: options['jit_threshold'] = None
+    limits = {}
+    for arg in sys.argv[1:]:
+        flag, _, value = arg.partition('=')
+        if flag in budget_flags: limits[flag[2:].replace('-', '_')] = budget_flags[flag](value)
+    if limits: options['budget'] = Budget(**limits)
+    if '--stats' in sys.argv: options['collect_stats'] = options['show_stats'] = True # counters cost time
+    processes = [arg.partition('=')[2] for arg in sys.argv[1:] if arg.startswith('--parse-processes=')]
+    if processes: options['parse_processes'] = int(processes[-1]) or None # 0 for one per core
+    if '--async' in sys.argv: options['use_async'] = True # sleep() and read_file() let spawned tasks run
+    stats_logs = [arg.partition('=')[2] for arg in sys.argv[1:] if arg.startswith('--stats-log=')]
+    if stats_logs: options['stats_log'] = open(stats_logs[-1], 'a') # json lines, appended per run
+
+    if len(args) > 1:
+        print("Usage: python nath.py [--jit-debug] [--no-jit] [--max-steps=N] [--timeout=SECONDS] " + 
+              "[--max-call-depth=N] [--max-sequence-length=N] [--stats] [--stats-log=PATH] [--async] " +
+              "[--parse-processes=N] [--watch] [path]")
         sys.exit(1)
-    elif len(sys.argv) == 2:
-        runtime = NathRuntime()
-        runtime.run_file(sys.argv[1])
+    elif len(args) == 1 and '--watch' in sys.argv:
+        options.pop('collect_stats', None), options.pop('stats_log', None), options.pop('use_async', None)
+        options.pop('show_stats', None)
+        options.pop('parse_processes', None)
+        watch(args[0], **options)
+    elif len(args) == 1:
+        runtime = NathRuntime(**options)
+        runtime.run_file(args[0])
     else: 
         repl.run()
 
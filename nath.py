@@ -0,0 +1,15 @@
+'''Embedding API, ie
+
+    import nath
+    program = nath.compile(source)
+    result = program.run(bindings={'x': 1.5}, capture_output=True)
+    result.bindings, result.output
+
+    nath.evaluate_columns("x, y -> 2x^2 + y", {'x': xs, 'y': ys})  # needs numpy
+'''
+from src.program import Program, RunResult, compile
+from src.errors import NathError, NathRuntimeError, NathSyntaxError
+from src.budget import Budget
+
+try: from src.batch import evaluate_columns, read_csv_columns
+except ImportError: pass # numpy isnt installed
@@ -30,10 +30,41 @@ class Range(AstNode):
     low: AstNode
     high: AstNode
     step: AstNode
+    dots: Token = None # for error locations
 @dataclass
 class FunctionCall(AstNode):
     callee: AstNode
     arguments: list[AstNode]
+    paren: Token = None # closing paren, for error locations
+@dataclass
+class ListLiteral(AstNode):
+    elements: list[AstNode]
+@dataclass
+class Index(AstNode):
+    target: AstNode
+    bracket: Token
+    index: AstNode # a Range node makes this a slice
+@dataclass
+class RecordLiteral(AstNode):
+    names: list[Token]
+    values: list[AstNode]
+    shape = None # of the records it makes, set by FreeVariables.resolve (or when it first runs)
+@dataclass
+class FieldAccess(AstNode):
+    target: AstNode
+    name: Token
+    # inline cache, the (shape, offset) of the last record it accessed. runs in other threads can
+    # overwrite it at any time, but it's replaced as one tuple and only used after checking the shape
+    cache = (None, 0)
+@dataclass
+class Spawn(AstNode): # spawn f(x), see src/tasks.py
+    callee: AstNode
+    arguments: list[AstNode]
+    keyword: Token
+@dataclass
+class Await(AstNode):
+    task: AstNode
+    keyword: Token
 
 ### Statements
 @dataclass
@@ -51,10 +82,21 @@ class AssignmentStatement(AstNode):
     operator: Token
     value: AstNode
 @dataclass
+class IndexAssignmentStatement(AstNode):
+    target: Index
+    operator: Token
+    value: AstNode
+@dataclass
+class FieldAssignmentStatement(AstNode):
+    target: FieldAccess
+    operator: Token
+    value: AstNode
+@dataclass
 class EachStatement(AstNode):
     var_name: Token
     iterable: AstNode
     body: Block
+    keyword: Token = None
 @dataclass
 class IfStatement(AstNode):
     condition: AstNode
@@ -64,13 +106,39 @@ class IfStatement(AstNode):
 class WhileStatement(AstNode):
     condition: AstNode
     body: Block
+    keyword: Token = None
 @dataclass  
 class FunctionDefinition(AstNode):
     parameters: list[Token]
     body: Block
+    number_body = None # copy of the body for calls with only number arguments, see src/type_inference.py
 @dataclass
 class ReturnStatement(AstNode):
     value: AstNode
 @dataclass
 class BreakStatement(AstNode):
-    pass
\ No newline at end of file
+    pass
+@dataclass
+class YieldStatement(AstNode):
+    value: AstNode
+### Made by the inliner (src/inliner.py), not the parser
+@dataclass
+class InlinedCall(AstNode):
+    call: FunctionCall                 # evaluated instead if the global isnt the inlined function
+    definition: FunctionDefinition     # of the global function ``call.callee``
+    expression: AstNode                # its returned expression, with Arguments and GlobalVariables
+@dataclass
+class Argument(AstNode):
+    name: Token
+    index: int
+@dataclass
+class GlobalVariable(AstNode):
+    name: Token
+### Made by the type inference (src/type_inference.py), operations on operands that are proven
+### to be numbers, so they skip the operand type checks
+@dataclass
+class NumberUnary(Unary): pass
+@dataclass
+class NumberBinary(Binary): pass
+@dataclass
+class NumberAssignment(AssignmentStatement): pass # augmented, ie x += 1
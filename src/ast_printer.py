@@ -29,6 +29,9 @@ class AstPrinter(Visitor):
         return f"print{self.recurse([stmt.expression])}"
     def visit_AssignmentStatement(self, stmt):
         return f"{stmt.operator.lexeme}({stmt.name.lexeme},{self.recurse([stmt.value], paren=False)})"
+    visit_NumberUnary = visit_Unary
+    visit_NumberBinary = visit_Binary
+    visit_NumberAssignment = visit_AssignmentStatement
     def visit_Variable(self, expr):
         return f"var({expr.name.lexeme})"
     def visit_Block(self, block):
@@ -41,6 +44,24 @@ class AstPrinter(Visitor):
         return f"each({expr.var_name.lexeme if expr.var_name else 'null'}, {self.recurse([expr.body], paren=False)})"
     def visit_WhileStatement(self, expr: ast.WhileStatement):
         return f"while{self.recurse([expr.body])}"
+    def visit_ListLiteral(self, expr: ast.ListLiteral):
+        return f"list{self.recurse(expr.elements)}"
+    def visit_Index(self, expr: ast.Index):
+        return f"index{self.recurse([expr.target, expr.index])}"
+    def visit_IndexAssignmentStatement(self, stmt: ast.IndexAssignmentStatement):
+        return f"{stmt.operator.lexeme}({self.recurse([stmt.target, stmt.value], paren=False)})"
+    def visit_RecordLiteral(self, expr: ast.RecordLiteral):
+        return "record(" + ",".join(f"{n.lexeme}:{v.accept(self)}" for n, v in zip(expr.names, expr.values)) + ")"
+    def visit_FieldAccess(self, expr: ast.FieldAccess):
+        return f"field{self.recurse([expr.target, expr.name])}"
+    def visit_FieldAssignmentStatement(self, stmt: ast.FieldAssignmentStatement):
+        return f"{stmt.operator.lexeme}({self.recurse([stmt.target, stmt.value], paren=False)})"
+    def visit_InlinedCall(self, expr: ast.InlinedCall):
+        return f"inlined{self.recurse([expr.call])}"
+    def visit_FunctionCall(self, expr: ast.FunctionCall):
+        return f"FunctionCall{self.recurse([expr.callee, expr.arguments])}"
+    def visit_FunctionDefinition(self, expr: ast.FunctionDefinition):
+        return f"FunctionDefinition{self.recurse([expr.parameters, expr.body])}"
     
     def recurse(self, exprs: list, paren=True, sep=','):
         vals = []
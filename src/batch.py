@@ -0,0 +1,194 @@
+'''Evaluates a single-expression Nath function over whole columns of data at once, ie
+
+       evaluate_columns("x, y -> 2x^2 + y", {'x': xs, 'y': ys})
+
+   Binary/Unary operators and calls to builtins are lowered to numpy array operations, so the
+   function is evaluated once for all rows instead of once per row. Results are float64 (bools
+   for comparisons). Functions that can't be vectorized are called per row on a process pool.'''
+import csv, os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import src.ast_nodes as ast
+from src.tokens import TokenType as tt
+from src.objects import NathFunction
+from src.program import Program
+from src import interpreter
+
+class CannotVectorize(Exception): pass
+
+# builtins that have a numpy equivalent
+ufuncs = {'sin': np.sin, 'cos': np.cos, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log}
+# operators that only take numbers (not bools) in the interpreter
+NUMBER_OPERATORS = frozenset([tt.PLUS, tt.MINUS, tt.STAR, tt.SLASH, tt.CARET, tt.GT, tt.GT_EQUAL, tt.LT, tt.LT_EQUAL])
+
+BATCH_NAME = '__batch__'
+
+def load_function(source: str, name: str=None) -> NathFunction:
+    '''``source`` is either a function expression, or a script that defines the function ``name``'''
+    if name is None: source, name = f"{BATCH_NAME} = {source}", BATCH_NAME
+    fn = Program(source).run(capture_output=True).bindings.get(name)
+    if not isinstance(fn, NathFunction):
+        raise ValueError(f"'{name}' is not a function")
+    return fn
+
+def evaluate_columns(source: str, columns, name: str=None, processes: int=None, chunk_size: int=10_000):
+    '''Evaluate a function for every row of ``columns``, which are either a dict of parameter name ->
+       array or a list of arrays in parameter order. ``processes=0`` does the per-row fallback in
+       this process. Returns a numpy array with one result per row.'''
+    fn = load_function(source, name)
+    params = [p.lexeme for p in fn.definition.parameters]
+    if isinstance(columns, dict):
+        missing = [p for p in params if p not in columns]
+        if missing: raise ValueError(f"No columns for parameters {missing}")
+        columns = [columns[p] for p in params]
+    if len(columns) != len(params):
+        raise ValueError(f"Function takes {len(params)} parameters but got {len(columns)} columns")
+    columns = [np.asarray(c, dtype=np.float64) for c in columns]
+    n_rows = len(columns[0]) if columns else 0
+
+    try:
+        result = Vectorizer(fn).evaluate(dict(zip(params, columns)))
+        return np.broadcast_to(result, (n_rows,)).copy()
+    except CannotVectorize:
+        pass
+
+    chunks = [[c[i:i+chunk_size] for c in columns] for i in range(0, n_rows, chunk_size)]
+    if processes == 0:
+        _init_worker(source, name)
+        results = [_evaluate_rows(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(processes or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(source, name)) as pool:
+            results = list(pool.map(_evaluate_rows, chunks))
+    values = [v for chunk in results for v in chunk]
+    try: return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError): return np.array(values, dtype=object)
+
+def read_csv_columns(path: str) -> dict:
+    '''Read a csv file with a header row into a dict of column name -> float64 array'''
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    return {name: np.array([float(row[i]) for row in rows]) for i, name in enumerate(header)}
+
+### per row fallback, runs in the worker processes
+_worker_fn = None
+
+def _init_worker(source, name):
+    global _worker_fn
+    _worker_fn = load_function(source, name)
+
+def _evaluate_rows(columns):
+    interp = _worker_fn.interpreter
+    return [interp.do_call(_worker_fn, row) for row in zip(*(c.tolist() for c in columns))]
+
+
+class Vectorizer():
+    '''Evaluates the expression of a single-expression function with numpy arrays as the
+       parameter values. Raises CannotVectorize for anything without an array equivalent.'''
+    MAX_INLINE_DEPTH = 8
+
+    def __init__(self, fn: NathFunction, depth=0):
+        if depth > self.MAX_INLINE_DEPTH: raise CannotVectorize("too many nested function calls")
+        self.fn = fn
+        self.depth = depth
+        self.expression = single_expression(fn)
+
+    def evaluate(self, params: dict):
+        self.params = params
+        return self.visit(self.expression)
+
+    def visit(self, node):
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        if method is None: raise CannotVectorize(f"{type(node).__name__} can't be vectorized")
+        return method(node)
+
+    def visit_Literal(self, expr: ast.Literal):
+        if type(expr.value) not in (int, float, bool): raise CannotVectorize("non number literal")
+        return float(expr.value) if type(expr.value) is int else expr.value
+
+    def visit_Grouping(self, expr: ast.Grouping):
+        return self.visit(expr.expression)
+
+    def visit_Variable(self, var: ast.Variable):
+        name = var.name.lexeme
+        if name in self.params: return self.params[name]
+        value = self.fn.closure.get_or_MISSING(var.name) # captured or global constants
+        if type(value) in (int, float, bool): return float(value) if type(value) is int else value
+        raise CannotVectorize(f"variable '{name}' isn't a number")
+
+    def visit_Unary(self, expr: ast.Unary):
+        value = self.visit(expr.expression)
+        if expr.operator.type in NUMBER_OPERATORS: number(value)
+        match expr.operator.type:
+            case tt.MINUS: return np.negative(value)
+            case tt.PLUS: return value
+            case tt.NOT: return np.logical_not(truthy(value))
+        raise CannotVectorize(f"unary '{expr.operator.lexeme}'")
+
+    def visit_Binary(self, expr: ast.Binary):
+        left, right = self.visit(expr.left), self.visit(expr.right)
+        if expr.operator.type in NUMBER_OPERATORS: number(left), number(right)
+        match expr.operator.type:
+            case tt.PLUS: return np.add(left, right)
+            case tt.MINUS: return np.subtract(left, right)
+            case tt.STAR: return np.multiply(left, right)
+            case tt.SLASH:
+                if np.any(np.equal(right, 0)): raise CannotVectorize("division by zero") # raises per row
+                return np.divide(left, right)
+            case tt.CARET: return in_range(np.power, left, right)
+            case tt.EQUAL_EQUAL: return np.equal(left, right)
+            case tt.BANG_EQUAL: return np.not_equal(left, right)
+            case tt.GT: return np.greater(left, right)
+            case tt.GT_EQUAL: return np.greater_equal(left, right)
+            case tt.LT: return np.less(left, right)
+            case tt.LT_EQUAL: return np.less_equal(left, right)
+            case tt.AND: return np.where(truthy(left), right, left)
+            case tt.OR: return np.where(truthy(left), left, right)
+        raise CannotVectorize(f"binary '{expr.operator.lexeme}'")
+
+    # operands proven to be numbers, see src/type_inference.py
+    visit_NumberUnary = visit_Unary
+    visit_NumberBinary = visit_Binary
+
+    def visit_InlinedCall(self, expr: ast.InlinedCall):
+        return self.visit_FunctionCall(expr.call)
+
+    def visit_FunctionCall(self, expr: ast.FunctionCall):
+        if not isinstance(expr.callee, ast.Variable): raise CannotVectorize("call of an expression")
+        callee = self.fn.closure.get_or_MISSING(expr.callee.name)
+        args = [self.visit(arg) for arg in expr.arguments]
+        if not isinstance(callee, NathFunction) or len(args) != callee.arity:
+            raise CannotVectorize("invalid call") # raises per row
+        name = expr.callee.name.lexeme
+        if interpreter.BUILTINS.get(name) is callee and name in ufuncs:
+            return in_range(ufuncs[name], *(number(arg) for arg in args))
+        # inline other single-expression functions
+        params = [p.lexeme for p in callee.definition.parameters] if callee.definition else []
+        return Vectorizer(callee, self.depth + 1).evaluate(dict(zip(params, args)))
+
+
+def single_expression(fn: NathFunction):
+    body = fn.definition.body.statements if fn.definition else []
+    if len(body) != 1 or not isinstance(body[0], ast.ReturnStatement) or body[0].value is None:
+        raise CannotVectorize("not a single-expression function")
+    return body[0].value
+
+def number(value):
+    if np.asarray(value).dtype == np.bool_: raise CannotVectorize("bool operand") # raises per row
+    return value
+
+def in_range(ufunc, *args):
+    '''``ufunc(*args)``, unless it gives nan or inf for finite arguments, where the interpreter
+       raises (ie log(-1), exp(1000)) or makes a complex number (ie (-8)^(1/3))'''
+    with np.errstate(all='ignore'): result = ufunc(*args)
+    out_of_range = ~np.isfinite(result)
+    for arg in args: out_of_range &= np.isfinite(arg)
+    if np.any(out_of_range): raise CannotVectorize(f"{ufunc.__name__} out of range") # per row
+    return result
+
+def truthy(value):
+    return np.not_equal(value, 0)
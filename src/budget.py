@@ -0,0 +1,66 @@
+import time
+
+from src.errors import NathRuntimeError
+from src.tokens import Token
+
+class Budget():
+    '''Resource limits for running untrusted scripts, None means unlimited.
+       - max_steps: loop iterations + function calls
+       - timeout: wall clock seconds per ``Interpreter.interpret()``
+       - max_call_depth: nesting of function calls
+       - max_sequence_length: length of ranges, strings and lists that get created
+       - max_int_bits: size of the ints that * ^ and ! make. the clock isnt read while one big
+         int operation runs, so this is limited (to a million bits) even if nothing else is
+       Exceeding a limit raises a NathRuntimeError at the loop/call/range that did it.'''
+
+    # the clock is only read every CHECK_INTERVAL steps, so a step is just a decrement and a compare
+    CHECK_INTERVAL = 1024
+
+    def __init__(self, max_steps: int=None, timeout: float=None, max_call_depth: int=None,
+                 max_sequence_length: int=None, max_int_bits: int=1_000_000):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_call_depth = max_call_depth
+        self.max_sequence_length = max_sequence_length
+        self.max_int_bits = max_int_bits
+        self.start()
+
+    def start(self):
+        self.steps = 0      # steps taken before the current interval
+        self.depth = 0
+        self.deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        self.countdown = self.next_interval()
+        self.interval = self.countdown
+
+    def next_interval(self):
+        if self.max_steps is None: return self.CHECK_INTERVAL
+        return max(1, min(self.CHECK_INTERVAL, self.max_steps + 1 - self.steps))
+
+    def step(self, where: Token|int):
+        self.countdown -= 1
+        if self.countdown <= 0: self.checkpoint(where)
+
+    def checkpoint(self, where):
+        self.steps += self.interval
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise NathRuntimeError(where, f"Exceeded the budget of {self.max_steps} steps")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise NathRuntimeError(where, f"Exceeded the time budget of {self.timeout}s")
+        self.countdown = self.interval = self.next_interval()
+
+    def enter_call(self, where: Token|int):
+        self.step(where)
+        self.depth += 1
+        if self.max_call_depth is not None and self.depth > self.max_call_depth:
+            self.depth -= 1
+            raise NathRuntimeError(where, f"Exceeded the maximum call depth of {self.max_call_depth}")
+
+    def check_length(self, length: int, where: Token|int):
+        if self.max_sequence_length is not None and length > self.max_sequence_length:
+            raise NathRuntimeError(where,
+                f"Sequence of length {length} exceeds the budget of {self.max_sequence_length}")
+
+    def check_int_bits(self, bits: int, where: Token|int):
+        '''``bits`` is an estimate of the size of an int result, made before computing it'''
+        if self.max_int_bits is not None and bits > self.max_int_bits:
+            raise NathRuntimeError(where, f"Integer of about {bits} bits exceeds the budget of {self.max_int_bits} bits")
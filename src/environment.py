@@ -5,31 +5,67 @@ from src.tokens import Token
 
 MISSING = object()
 
+class Cell():
+    '''A boxed binding that is shared between the scope that owns a variable and the
+       closures that capture it (like lua upvalues). A cell can be unbound (MISSING)
+       when a closure refers to a name that its enclosing scope hasnt defined yet.'''
+    __slots__ = ('value',)
+    def __init__(self, value=MISSING):
+        self.value = value
+    def __repr__(self):
+        return f"Cell({self.value!r})" if self.value is not MISSING else "Cell(unbound)"
+
 class Environment():
     def __init__(self, parent=None):
         self.dict = {}
         self.parent = parent
-        
+
     def assign_or_define(self, name: str, value):
         did_assign = self.assign(name, value)
         if not did_assign:
             self.define(name, value)
- 
+
     def assign(self, name, value):
-        if self.dict.get(name) is not None:
-            self.dict[name] = value 
+        current = self.dict.get(name)
+        if type(current) is Cell:
+            if current.value is not None and current.value is not MISSING:
+                current.value = value
+                return True
+        elif current is not None:
+            self.dict[name] = value
             return True
-        elif self.parent is not None: 
+        if self.parent is not None:
             self.parent.assign(name, value)
-        else: 
+        else:
             return False
-    
+
     def define(self, name, value):
-        self.dict[name] = value
+        current = self.dict.get(name)
+        if type(current) is Cell: current.value = value
+        else: self.dict[name] = value
+
+    def owner(self):
+        '''The scope that new variables are defined in'''
+        return self
+
+    def capture(self, name: str, stop_at) -> Cell:
+        '''Find the cell for ``name`` in this scope or its ancestors (not including ``stop_at``),
+           boxing the value in a cell if needed. Returns None if the name isnt bound anywhere.'''
+        env = self
+        while env is not None:
+            if env is not stop_at:
+                value = env.dict.get(name, MISSING)
+                if type(value) is Cell: return value
+                if value is not MISSING:
+                    cell = env.dict[name] = Cell(value)
+                    return cell
+            env = env.parent
+        return None
 
     def get_or_MISSING(self, token: Token):
         value = self.dict.get(token.lexeme, MISSING)
-        if value is MISSING and self.parent is not None: 
+        if type(value) is Cell: value = value.value
+        if value is MISSING and self.parent is not None:
             return self.parent.get_or_MISSING(token)
         return value
 
@@ -37,4 +73,17 @@ class Environment():
         value = self.get_or_MISSING(token)
         if value is MISSING:
             raise NathRuntimeError(token, f"Undefined variable '{token.lexeme}'")
-        return value
\ No newline at end of file
+        return value
+
+
+class LoopScope(Environment):
+    '''Holds the variable of an each-loop while the body runs. Variables that the body defines 
+       go to the enclosing scope, so they are still visible after the loop.'''
+    def bind(self, name, value):
+        Environment.define(self, name, value)
+
+    def define(self, name, value):
+        self.parent.define(name, value)
+
+    def owner(self):
+        return self.parent.owner()
@@ -6,6 +6,8 @@ class NathError(Exception):
         super().__init__(msg)
         self.msg = msg
         self.where = where
+    def __reduce__(self): # so errors can be sent back from worker processes
+        return (type(self), (self.where, self.msg))
 
 class NathRuntimeError(NathError): pass
 class NathSyntaxError(NathError): pass
@@ -0,0 +1,105 @@
+import src.ast_nodes as ast
+from src.tokens import TokenType as tt
+
+class Inliner():
+    '''Replaces calls of one-line global functions, ie ``f = x -> 2x + 1``, with their expression
+       so a call doesn't need an Environment, a Block and a Return exception. Only functions that
+       are defined by a top level statement and never assigned again are inlined, and only where
+       no enclosing function has a parameter with the same name. The parameters become Argument
+       nodes that read the evaluated arguments, the other names GlobalVariables, since that's
+       where a top level function looks them up. An InlinedCall still checks that the global is
+       the inlined function when it runs (it might not be defined yet) and otherwise makes the call.
+
+       Modifies the syntax tree, so it should run once before the program is interpreted.'''
+
+    def inline(self, statements: list) -> list:
+        self.functions = self.inlinable_functions(statements)
+        if self.functions:
+            for stmt, _ in statements: self.rewrite(stmt, shadowed=frozenset())
+        return statements
+
+    def inlinable_functions(self, statements) -> dict:
+        assignments = {}
+        def count(node):
+            if isinstance(node, ast.AssignmentStatement): key = node.name.lexeme
+            elif isinstance(node, ast.EachStatement) and node.var_name: key = node.var_name.lexeme
+            else: key = None
+            if key: assignments[key] = assignments.get(key, 0) + 1
+            for child in children(node): count(child)
+        for stmt, _ in statements: count(stmt)
+
+        functions = {}
+        for stmt, _ in statements:
+            if not isinstance(stmt, ast.AssignmentStatement) or stmt.operator.type != tt.EQUAL: continue
+            value = stmt.value
+            while isinstance(value, ast.Grouping): value = value.expression
+            name = stmt.name.lexeme
+            if isinstance(value, ast.FunctionDefinition) and assignments[name] == 1:
+                expression = returned_expression(value.body)
+                if expression is not None and not contains_function(expression):
+                    functions[name] = value
+        return functions
+
+    ### rewriting call sites in place
+    def rewrite(self, node, shadowed):
+        if isinstance(node, ast.FunctionDefinition):
+            shadowed = shadowed | {p.lexeme for p in node.parameters}
+        for field, value in node.__dict__.items():
+            if isinstance(value, list):
+                for i, child in enumerate(value):
+                    if isinstance(child, ast.AstNode): value[i] = self.rewrite_child(child, shadowed)
+            elif isinstance(value, ast.AstNode):
+                setattr(node, field, self.rewrite_child(value, shadowed))
+        return node
+
+    def rewrite_child(self, node, shadowed):
+        node = self.rewrite(node, shadowed)
+        if isinstance(node, ast.FunctionCall) and isinstance(node.callee, ast.Variable):
+            name = node.callee.name.lexeme
+            if name not in shadowed: return self.inlined(node, name, active=())
+        return node
+
+    def inlined(self, call: ast.FunctionCall, name: str, active: tuple):
+        definition = self.functions.get(name)
+        if definition is None or name in active or len(call.arguments) != len(definition.parameters):
+            return call
+        params = {p.lexeme: i for i, p in enumerate(definition.parameters)}
+        expression = self.substitute(returned_expression(definition.body), params, active + (name,))
+        return ast.InlinedCall(call, definition, expression)
+
+    def substitute(self, node, params: dict, active: tuple):
+        '''Copy of the expression ``node`` of an inlined function, with its own calls inlined too
+           (apart from recursive ones)'''
+        if isinstance(node, ast.InlinedCall): # the function body was rewritten already
+            return self.substitute(node.call, params, active)
+        if isinstance(node, ast.Variable):
+            if node.name.lexeme in params: return ast.Argument(node.name, params[node.name.lexeme])
+            return ast.GlobalVariable(node.name)
+        fields = {}
+        for field, value in node.__dict__.items():
+            if isinstance(value, list):
+                value = [self.substitute(v, params, active) if isinstance(v, ast.AstNode) else v for v in value]
+            elif isinstance(value, ast.AstNode):
+                value = self.substitute(value, params, active)
+            fields[field] = value
+        copy = type(node)(**fields)
+        if isinstance(node, ast.FunctionCall) and isinstance(node.callee, ast.Variable) \
+                and node.callee.name.lexeme not in params:
+            return self.inlined(copy, node.callee.name.lexeme, active)
+        return copy
+
+
+def returned_expression(body: ast.Block):
+    '''The expression of a function body like ``x -> 2x``, or None if the body is more than that'''
+    body = body.statements
+    if len(body) == 1 and type(body[0]) is ast.ReturnStatement: return body[0].value
+    return None
+
+def children(node):
+    for value in node.__dict__.values():
+        if isinstance(value, list): yield from (v for v in value if isinstance(v, ast.AstNode))
+        elif isinstance(value, ast.AstNode): yield value
+
+def contains_function(node) -> bool:
+    # nested functions would need a closure over the arguments
+    return isinstance(node, ast.FunctionDefinition) or any(contains_function(c) for c in children(node))
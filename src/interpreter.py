@@ -1,32 +1,64 @@
 from typing import Any, Tuple
-import math
+from copy import copy
+from collections.abc import Iterator
+import math, operator
 
-from src.environment import Environment, MISSING
+from src.environment import Environment, LoopScope, Cell, MISSING
+from src.resolver import FreeVariables
 import src.ast_nodes as ast
 from src.tokens import Token, TokenType as tt
 from src.errors import NathRuntimeError
 from src.visitor import Visitor, Visitee
-from src.objects import NathFunction, Return, Break
-from src import nath_builtins
+from src.objects import NathFunction, NathArray, Record, Return, Break, NUMBER, close_iterator, shape_of
+from src import nath_builtins, tasks
+from src.jit import Jit
+from src.budget import Budget
+
+# for operands that are proven to be numbers (see src/type_inference.py), division checks for zero itself
+number_operations = {
+    tt.PLUS: operator.add, tt.MINUS: operator.sub, tt.STAR: operator.mul, tt.CARET: operator.pow,
+    tt.GT: operator.gt, tt.GT_EQUAL: operator.ge, tt.LT: operator.lt, tt.LT_EQUAL: operator.le,
+    tt.PLUS_EQUAL: operator.add, tt.MINUS_EQUAL: operator.sub, tt.STAR_EQUAL: operator.mul,
+    tt.CARET_EQUAL: operator.pow,
+}
+# the ones that can make huge ints, checked against the budget
+big_int_operations = {tt.STAR: tt.STAR, tt.STAR_EQUAL: tt.STAR, tt.CARET: tt.CARET, tt.CARET_EQUAL: tt.CARET}
+
+def load_builtins() -> dict:
+    builtins = {}
+    for name, arity in nath_builtins.functions: 
+        func = NathFunction(name=name)
+        func.arity = arity
+        func.call = getattr(nath_builtins, f"_{name}")
+        builtins[name] = func
+    return builtins
+
+# builtin functions dont depend on the interpreter, so they are created once and shared
+BUILTINS = load_builtins()
 
 class Interpreter(Visitor):
-    def __init__(self, in_repl=False):
+    def __init__(self, in_repl=False, jit_threshold=100, jit_debug=False, budget: Budget=None, output=None):
         self.in_repl = in_repl
+        # resource limits for untrusted scripts, see src/budget.py. copied since it counts per run
+        self.budget = copy(budget) if budget is not None else None
+        self.output = output # file that print statements write to, None means stdout
+        self.arguments = None # of the innermost inlined call, see src/inliner.py
         self.global_scope = Environment()
         self.env = self.global_scope
-
-        # add builtin functions to global scope
-        for name, arity in nath_builtins.functions: 
-            func = NathFunction(name=name)
-            func.arity = arity
-            func.call = getattr(nath_builtins, f"_{name}")
-            self.global_scope.define(name, func)
+        self.free_variables = FreeVariables()
+        # functions called more than jit_threshold times are compiled to python, None turns this off
+        self.jit = Jit(self, jit_threshold, jit_debug) if jit_threshold is not None else None
+        self.global_scope.dict.update(BUILTINS)
 
     ### API entry point
     def interpret(self, statements: list[Tuple[int, ast.AstNode]]) -> None:
+        if self.budget is not None: self.budget.start()
         for stmt, i in statements:
             self.stmt_line_num = i # for printing errors when we dont know the exact token we're at
-            self.evaluate(stmt)
+            try:
+                self.evaluate(stmt)
+            except RecursionError:
+                raise NathRuntimeError(i, "Maximum recursion depth exceeded") from None
     
     ### Helper methods ----------------------------------------------------------------
     def evaluate(self, expr_or_stmt, *args, **kwargs):
@@ -45,7 +77,7 @@ class Interpreter(Visitor):
     def assert_types(self, token, vals: list, types: tuple, same_types=True, msg: str=None):
         types = tuple(types)
         for v in vals:
-            if not isinstance(v, types):
+            if type(v) not in types: # exact check so that bools dont pass as ints
                 msg = msg or f"Operands to {token.lexeme} must be of type " + \
                              f"[{' or '.join([t.__name__ for t in types])}], " + \
                              f"but have types {[type(v).__name__ for v in vals]}"
@@ -56,6 +88,11 @@ class Interpreter(Visitor):
             return int(value)
         return None
 
+    def assert_iterable(self, value):
+        if not isinstance(value, (NathArray, list, str, Iterator)):
+            raise NathRuntimeError(-69, f"Can't loop over object of type '{type(value).__name__}'")
+        return value
+
     def is_truthy(self, val: Any) -> bool:
         # just use the same rules as python for now (empty iterables, 0 and None are falsy)
         return bool(val)
@@ -73,31 +110,45 @@ class Interpreter(Visitor):
 
     # Arithmetic
     def do_add(self, left, right, opnode):
-        if type(left) != type(right): # cant add strings and numbers
+        if type(left) != type(right) and not (type(left) in NUMBER and type(right) in NUMBER):
+            # cant add strings and numbers, but ints and floats mix
             raise NathRuntimeError(opnode, 
             "Operands to + must be of the same type, " + 
             f"but have types {[type(left).__name__, type(right).__name__]}")
-        self.assert_types(opnode, [left, right], [float, str])
+        self.assert_types(opnode, [left, right], [*NUMBER, str])
+        if self.budget is not None and type(left) is str:
+            self.budget.check_length(len(left) + len(right), opnode)
         return left + right
 
     def do_sub(self, left, right, opnode):
-        self.assert_types(opnode, [left, right], [float])
+        self.assert_types(opnode, [left, right], NUMBER)
         return left - right
 
     def do_mul(self, left, right, opnode):
-        self.assert_types(opnode, [left, right], [float])
+        self.assert_types(opnode, [left, right], NUMBER)
+        if self.budget is not None: self.check_int_size(left, right, tt.STAR, opnode)
         return left * right
         
     def do_div(self, left, right, opnode):
-        self.assert_types(opnode, [left, right], [float])
+        self.assert_types(opnode, [left, right], NUMBER)
         if right == 0:
             raise NathRuntimeError(opnode, "Division by zero")
         return left / right
 
     def do_pow(self, left, right, opnode):
-        self.assert_types(opnode, [left, right], [float])
+        self.assert_types(opnode, [left, right], NUMBER)
+        if self.budget is not None: self.check_int_size(left, right, tt.CARET, opnode)
         return left ** right
 
+    def check_int_size(self, left, right, op_type, opnode):
+        '''Exact ints can get big enough that computing them takes minutes, so their size is
+           checked against the budget before'''
+        if type(left) is not int or type(right) is not int: return
+        if op_type == tt.STAR: bits = left.bit_length() + right.bit_length()
+        elif abs(left) > 1 and right > 0: bits = right * abs(left).bit_length()
+        else: return
+        self.budget.check_int_bits(bits, opnode)
+
 
     ### Visitor methods ---------------------------------------------------------------
     def visit_Block(self, block: ast.Block, block_env=None) -> None:
@@ -112,24 +163,27 @@ class Interpreter(Visitor):
             self.env = prev_env
 
     def visit_EachStatement(self, stmt: ast.EachStatement) -> None:
-        iterable = self.evaluate(stmt.iterable)
-        if not isinstance(iterable, (list, str)):
-            raise NathRuntimeError(-69, f"Can't loop over object of type '{type(iterable).__name__}'")
+        iterable = self.assert_iterable(self.evaluate(stmt.iterable))
 
-        loop_varname_scope = Environment(parent=self.env.parent)
-        self.env.parent = loop_varname_scope
+        loop_scope = LoopScope(parent=self.env)
+        prev_env, self.env = self.env, loop_scope
+        budget = self.budget
         try:
             for elem in iterable:
+                if budget is not None: budget.step(stmt.keyword)
                 if stmt.var_name:
-                    loop_varname_scope.define(stmt.var_name.lexeme, elem)
+                    loop_scope.bind(stmt.var_name.lexeme, elem)
                 self.evaluate(stmt.body)
         except Break: pass
         finally:
-            self.env.parent = self.env.parent.parent
+            self.env = prev_env
+            close_iterator(iterable)
     
     def visit_WhileStatement(self, stmt: ast.WhileStatement):
+        budget = self.budget
         try:
             while self.is_truthy(self.evaluate(stmt.condition)):
+                if budget is not None: budget.step(stmt.keyword)
                 self.evaluate(stmt.body)
         except Break: pass
     
@@ -140,19 +194,22 @@ class Interpreter(Visitor):
             self.evaluate(stmt.else_branch)
             
     def visit_PrintStatement(self, stmt: ast.PrintStatement) -> None:
-        print(self.evaluate(stmt.expression))
+        print(self.evaluate(stmt.expression), file=self.output)
     
     def visit_ExpressionStatement(self, stmt: ast.ExpressionStatement) -> None:
         result = self.evaluate(stmt.expression)
-        if self.in_repl: print(self.stringify(result))
+        if self.in_repl: print(self.stringify(result), file=self.output)
     
     def visit_AssignmentStatement(self, stmt: ast.AssignmentStatement) -> None:
         if stmt.operator.type != tt.EQUAL:
             return self.augmented_assignment(stmt)
 
         var = stmt.name
-        rhs = self.evaluate(stmt.value)
-        if isinstance(rhs, NathFunction): rhs.name = var.lexeme
+        value = stmt.value
+        while isinstance(value, ast.Grouping): value = value.expression
+        if isinstance(value, ast.FunctionDefinition): # name functions where they are defined, ie f = x -> 2x
+            rhs = self.visit_FunctionDefinition(value, name=var.lexeme)
+        else: rhs = self.evaluate(stmt.value)
         self.env.assign_or_define(var.lexeme, rhs)
     
     def augmented_assignment(self, stmt: ast.AssignmentStatement):
@@ -163,6 +220,10 @@ class Interpreter(Visitor):
             f"'{stmt.operator.lexeme}' on undefined variable {var.lexeme}")
         
         rhs = self.evaluate(stmt.value)
+        value = self.augmented_operation(lhs, rhs, stmt.operator)
+        self.env.assign_or_define(var.lexeme, value)
+
+    def augmented_operation(self, lhs, rhs, operator: Token):
         ops = {
             tt.PLUS_EQUAL: self.do_add,
             tt.MINUS_EQUAL: self.do_sub,
@@ -170,22 +231,126 @@ class Interpreter(Visitor):
             tt.SLASH_EQUAL: self.do_div,
             tt.CARET_EQUAL: self.do_pow,
         }
+        return ops[operator.type](lhs, rhs, operator)
 
-        value = ops[stmt.operator.type](lhs, rhs, stmt.operator)
+    def visit_NumberAssignment(self, stmt: ast.NumberAssignment):
+        var = stmt.name
+        value = self.number_operation(self.env.get_or_MISSING(var), self.evaluate(stmt.value), stmt.operator)
         self.env.assign_or_define(var.lexeme, value)
 
-    def visit_FunctionDefinition(self, expr: ast.FunctionDefinition):
-        return NathFunction(interpreter=self, definition=expr, closure=self.env)
+    def visit_IndexAssignmentStatement(self, stmt: ast.IndexAssignmentStatement):
+        target = self.evaluate(stmt.target.target)
+        index = self.evaluate(stmt.target.index)
+        self.do_set_index(target, index, self.evaluate(stmt.value), stmt.operator, stmt.target.bracket)
+
+    def do_set_index(self, target, index, rhs, operator: Token, bracket: Token):
+        if not isinstance(target, NathArray):
+            raise NathRuntimeError(bracket, f"Can't assign to an index of type '{type(target).__name__}'")
+        i = self.array_position(target, index, bracket)
+        if operator.type != tt.EQUAL:
+            rhs = self.augmented_operation(target.get(i), rhs, operator)
+        target.set(i, rhs)
+
+    def visit_FieldAssignmentStatement(self, stmt: ast.FieldAssignmentStatement):
+        record = self.evaluate(stmt.target.target)
+        self.do_set_field(record, self.evaluate(stmt.value), stmt.operator, stmt.target)
+
+    def do_set_field(self, record, value, operator: Token, field: ast.FieldAccess):
+        shape, offset = field.cache
+        if type(record) is not Record or record.shape is not shape:
+            name = field.name.lexeme
+            if type(record) is not Record:
+                raise NathRuntimeError(field.name, f"Can't assign to field '{name}' of type '{type(record).__name__}'")
+            offset = record.shape.offsets.get(name)
+            if offset is None:
+                if operator.type != tt.EQUAL:
+                    raise NathRuntimeError(operator, f"'{operator.lexeme}' on undefined field '{name}'")
+                record.add_field(name, value)
+                return
+            field.cache = (record.shape, offset)
+        if operator.type != tt.EQUAL:
+            value = self.augmented_operation(record.values[offset], value, operator)
+        record.values[offset] = value
+
+    def visit_FunctionDefinition(self, expr: ast.FunctionDefinition, name: str=None):
+        # flat closure: only capture cells for the free variables of the body instead of
+        # keeping the whole enclosing scope chain alive. globals are looked up dynamically
+        closure = Environment(parent=self.global_scope)
+        owner = self.env.owner()
+        for var in self.free_variables.free_names(expr):
+            cell = self.env.capture(var, stop_at=self.global_scope)
+            if cell is None:
+                if owner is self.global_scope: continue
+                # not bound yet, but the enclosing scope might define it later (ie recursive inner functions)
+                cell = Cell()
+                owner.dict[var] = cell
+            closure.dict[var] = cell
+        return NathFunction(interpreter=self, definition=expr, closure=closure, name=name)
     
     def visit_FunctionCall(self, expr: ast.FunctionCall):
         callee = self.evaluate(expr.callee)
-        if not isinstance(callee, NathFunction):
-            raise NathRuntimeError(-69, f"{type(callee).__name__} is not callable")
+        arguments = [self.evaluate(arg) for arg in expr.arguments]
+        return self.do_call(callee, arguments, expr.paren)
+
+    def visit_InlinedCall(self, expr: ast.InlinedCall):
+        callee = self.global_scope.dict.get(expr.call.callee.name.lexeme)
+        if type(callee) is not NathFunction or callee.definition is not expr.definition:
+            return self.visit_FunctionCall(expr.call) # not (yet) the function that was inlined
+        arguments = [self.evaluate(arg) for arg in expr.call.arguments]
+        outer, self.arguments = self.arguments, arguments
+        budget = self.budget
+        try:
+            if budget is not None: budget.enter_call(expr.call.paren)
+            return self.evaluate(expr.expression)
+        finally:
+            self.arguments = outer
+            if budget is not None: budget.depth -= 1
 
+    ### tasks, see src/tasks.py
+    def visit_Spawn(self, expr: ast.Spawn):
+        task = self.current_task(expr.keyword)
+        callee = self.evaluate(expr.callee)
         arguments = [self.evaluate(arg) for arg in expr.arguments]
+        if not isinstance(callee, NathFunction):
+            raise NathRuntimeError(expr.keyword, f"{type(callee).__name__} is not callable")
+        if len(arguments) != callee.arity:
+            raise NathRuntimeError(expr.keyword, f"Expected {callee.arity} arguments but got {len(arguments)}")
+        return task.runtime.spawn(lambda: self.do_call(callee, arguments, expr.keyword), expr.keyword)
+
+    def visit_Await(self, expr: ast.Await):
+        current = self.current_task(expr.keyword)
+        task = self.evaluate(expr.task)
+        if type(task) is not tasks.Task:
+            raise NathRuntimeError(expr.keyword, f"Can't await type '{type(task).__name__}'")
+        return current.wait_for(task)
+
+    def current_task(self, keyword: Token) -> tasks.Task:
+        task = tasks.current_task()
+        if task is None or task.runtime.interpreter is not self:
+            raise NathRuntimeError(keyword, f"'{keyword.lexeme}' only works in the async runtime (Program.run_async, --async)")
+        return task
+
+    def visit_Argument(self, arg: ast.Argument):
+        return self.arguments[arg.index]
+
+    def visit_GlobalVariable(self, var: ast.GlobalVariable):
+        return self.global_scope.get_or_error(var.name)
+
+    def do_call(self, callee, arguments: list, paren: Token=None):
+        where = paren or -69
+        if not isinstance(callee, NathFunction):
+            raise NathRuntimeError(where, f"{type(callee).__name__} is not callable")
         if len(arguments) != callee.arity:
-            raise NathRuntimeError(-69, f"Expected {callee.arity} arguments but got {len(arguments)}")
-        return callee.call(*arguments)
+            raise NathRuntimeError(where, f"Expected {callee.arity} arguments but got {len(arguments)}")
+        budget = self.budget
+        if budget is None: return callee.call(*arguments)
+        grows = nath_builtins.result_lengths.get(callee.name) if callee.definition is None else None
+        if grows is not None: budget.check_length(grows(*arguments), where)
+        budget.enter_call(where)
+        try:
+            return callee.call(*arguments)
+        finally:
+            budget.depth -= 1
     
     def visit_ReturnStatement(self, stmt: ast.ReturnStatement):
         if stmt.value is not None: 
@@ -197,12 +362,77 @@ class Interpreter(Visitor):
         raise Break()
     
     def visit_Range(self, r: ast.Range):
-        args = [r.low, r.high, r.step]
-        args = [self.assert_int_like(self.evaluate(x)) for x in args]
+        return self.make_range(self.range_indices(r), r.dots)
+
+    def make_range(self, indices: range, dots: Token=None):
+        if self.budget is not None: self.budget.check_length(len(indices), dots or -69)
+        return NathArray(indices)
+            
+    def range_indices(self, r: ast.Range) -> range:
+        return self.int_range(self.evaluate(r.low), self.evaluate(r.high), self.evaluate(r.step))
+
+    def int_range(self, *args) -> range:
+        args = [self.assert_int_like(x) for x in args]
         if any([x is None for x in args]):
             raise NathRuntimeError(-69, "Arguments to range constructor low..high..step must be integers")
-        return [float(x) for x in range(args[0], args[1]+1, args[2])]
-            
+        return range(args[0], args[1]+1, args[2])
+
+    def visit_ListLiteral(self, expr: ast.ListLiteral):
+        return NathArray([self.evaluate(e) for e in expr.elements])
+
+    def array_position(self, target, index, bracket: Token):
+        if type(index) is not int:
+            raise NathRuntimeError(bracket, f"Index must be an integer, but got {type(index).__name__}")
+        if not 0 <= index < len(target):
+            raise NathRuntimeError(bracket, f"Index {index} out of range for sequence of length {len(target)}")
+        return index
+
+    def visit_Index(self, expr: ast.Index):
+        target = self.assert_indexable(self.evaluate(expr.target), expr.bracket)
+        if isinstance(expr.index, ast.Range): # slice, inclusive like ranges
+            return self.do_slice(target, self.range_indices(expr.index), expr.bracket)
+        return self.do_index(target, self.evaluate(expr.index), expr.bracket)
+
+    def assert_indexable(self, target, bracket: Token):
+        if not isinstance(target, (NathArray, str)):
+            raise NathRuntimeError(bracket, f"Can't index object of type '{type(target).__name__}'")
+        return target
+
+    def do_slice(self, target, indices: range, bracket: Token):
+        if len(indices) and not (0 <= indices[0] < len(target) and 0 <= indices[-1] < len(target)):
+            raise NathRuntimeError(bracket, 
+                f"Slice {indices.start}..{indices.stop-1} out of range for sequence of length {len(target)}")
+        if isinstance(target, str):
+            if indices.step > 0: return target[indices.start:indices.stop:indices.step]
+            return "".join(target[i] for i in indices)
+        return target.slice(indices)
+
+    def do_index(self, target, index, bracket: Token):
+        i = self.array_position(target, index, bracket)
+        return target[i] if isinstance(target, str) else target.get(i)
+
+    def visit_RecordLiteral(self, expr: ast.RecordLiteral):
+        shape = expr.shape # set up front for Programs
+        if shape is None: shape = expr.shape = shape_of(name.lexeme for name in expr.names)
+        return Record(shape, [self.evaluate(v) for v in expr.values])
+
+    def visit_FieldAccess(self, expr: ast.FieldAccess):
+        record = self.evaluate(expr.target)
+        shape, offset = expr.cache
+        if type(record) is Record and record.shape is shape: return record.values[offset]
+        return self.get_field(record, expr)
+
+    def get_field(self, record, field: ast.FieldAccess):
+        '''Looks the field up in the shape of the record, and caches where it is on the node'''
+        name = field.name.lexeme
+        if type(record) is not Record:
+            raise NathRuntimeError(field.name, f"Can't get field '{name}' of type '{type(record).__name__}'")
+        offset = record.shape.offsets.get(name)
+        if offset is None:
+            raise NathRuntimeError(field.name, f"Record has no field '{name}'")
+        field.cache = (record.shape, offset)
+        return record.values[offset]
+
     def visit_Variable(self, var: ast.Variable):
         return self.env.get_or_error(var.name)
 
@@ -213,22 +443,27 @@ class Interpreter(Visitor):
         return self.visit(expr.expression)
 
     def visit_Unary(self, expr: ast.Unary):
-        expr_val = self.evaluate(expr.expression)
-        match(expr.operator.type):
+        return self.do_unary(self.evaluate(expr.expression), expr.operator)
+
+    def do_unary(self, expr_val, operator: Token):
+        match(operator.type):
             case tt.MINUS: 
-                self.assert_types(expr.operator, [expr_val], [float])
+                self.assert_types(operator, [expr_val], NUMBER)
                 return -expr_val
             case tt.PLUS: 
-                self.assert_types(expr.operator, [expr_val], [float])
+                self.assert_types(operator, [expr_val], NUMBER)
                 return expr_val
             case tt.NOT: 
                 return not self.is_truthy(expr_val)
             case tt.BANG:
-                self.assert_types(expr.operator, [expr_val], [float])
+                self.assert_types(operator, [expr_val], NUMBER)
                 expr_val_int = int(expr_val)
                 if not expr_val_int == expr_val:
-                    raise NathRuntimeError(expr.operator, 
+                    raise NathRuntimeError(operator, 
                     f"Factorial operator '!' doesnt take decimal numbers, but received {expr_val}")
+                if type(expr_val) is int: # exact
+                    if self.budget is not None: self.budget.check_int_bits(expr_val * expr_val.bit_length(), operator)
+                    return math.factorial(expr_val)
                 return float(math.factorial(expr_val_int))
 
     def visit_Binary(self, expr: ast.Binary):
@@ -236,24 +471,41 @@ class Interpreter(Visitor):
             return self.logical_binary(expr)
         left = self.evaluate(expr.left)
         right = self.evaluate(expr.right)
+        return self.do_binary(left, right, expr.operator)
+
+    def visit_NumberBinary(self, expr: ast.NumberBinary):
+        return self.number_operation(self.evaluate(expr.left), self.evaluate(expr.right), expr.operator)
+
+    def number_operation(self, left, right, operator: Token):
+        if operator.type in (tt.SLASH, tt.SLASH_EQUAL):
+            if right == 0: raise NathRuntimeError(operator, "Division by zero")
+            return left / right
+        if self.budget is not None and operator.type in big_int_operations:
+            self.check_int_size(left, right, big_int_operations[operator.type], operator)
+        return number_operations[operator.type](left, right)
+
+    def visit_NumberUnary(self, expr: ast.NumberUnary):
+        value = self.evaluate(expr.expression)
+        return -value if expr.operator.type == tt.MINUS else value
 
-        match(expr.operator.type):
-            case tt.PLUS: return self.do_add(left, right, expr.operator)
-            case tt.MINUS: return self.do_sub(left, right, expr.operator)
-            case tt.STAR: return self.do_mul(left, right, expr.operator)
-            case tt.SLASH: return self.do_div(left, right, expr.operator)
-            case tt.CARET: return self.do_pow(left, right, expr.operator)
+    def do_binary(self, left, right, operator: Token):
+        match(operator.type):
+            case tt.PLUS: return self.do_add(left, right, operator)
+            case tt.MINUS: return self.do_sub(left, right, operator)
+            case tt.STAR: return self.do_mul(left, right, operator)
+            case tt.SLASH: return self.do_div(left, right, operator)
+            case tt.CARET: return self.do_pow(left, right, operator)
             case tt.EQUAL_EQUAL: return self.is_equal(left, right)
             case tt.BANG_EQUAL: return not self.is_equal(left, right)
             case tt.GT: 
-                self.assert_types(expr.operator, [left, right], [float])
+                self.assert_types(operator, [left, right], NUMBER)
                 return left > right
             case tt.GT_EQUAL: 
-                self.assert_types(expr.operator, [left, right], [float])
+                self.assert_types(operator, [left, right], NUMBER)
                 return left >= right
             case tt.LT: 
-                self.assert_types(expr.operator, [left, right], [float])
+                self.assert_types(operator, [left, right], NUMBER)
                 return left < right
             case tt.LT_EQUAL: 
-                self.assert_types(expr.operator, [left, right], [float])
+                self.assert_types(operator, [left, right], NUMBER)
                 return left <= right
\ No newline at end of file
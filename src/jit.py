@@ -0,0 +1,404 @@
+'''Tiered execution: once a NathFunction has been called ``threshold`` times its definition is
+   translated to python source, compiled with ``compile()`` and the result replaces ``NathFunction.call``.
+   Parameters and locals become python locals, each/while become python for/while loops.
+   Functions we can't translate with the exact same semantics (nested function definitions,
+   assignments to captured variables, locals that might be read before they are assigned, ...)
+   stay interpreted.'''
+import math, threading
+
+from src.visitor import Visitor
+import src.ast_nodes as ast
+from src.tokens import TokenType as tt
+from src.environment import MISSING
+from src.objects import NathFunction, NathArray, Record, NUMBER, close_iterator, shape_of
+
+class CannotCompile(Exception): pass
+
+def is_number_literal(src: str):
+    try: float(src)
+    except ValueError: return False
+    return True
+
+# fast paths for number operands, anything else goes through the interpreter which raises the proper error
+arithmetic = {
+    tt.PLUS: ('+', '_add'), tt.MINUS: ('-', '_sub'), tt.STAR: ('*', '_mul'),
+    tt.SLASH: ('/', '_div'), tt.CARET: ('**', '_pow'),
+}
+big_ints = frozenset([tt.STAR, tt.CARET]) # can make ints that are too big for a budget
+comparisons = {tt.GT: '>', tt.GT_EQUAL: '>=', tt.LT: '<', tt.LT_EQUAL: '<='}
+augmented = {
+    tt.PLUS_EQUAL: tt.PLUS, tt.MINUS_EQUAL: tt.MINUS, tt.STAR_EQUAL: tt.STAR,
+    tt.SLASH_EQUAL: tt.SLASH, tt.CARET_EQUAL: tt.CARET,
+}
+
+# the translations are cached on the (shared) FunctionDefinition nodes
+cache_lock = threading.Lock()
+
+class Jit():
+    def __init__(self, interpreter, threshold: int, debug=False):
+        self.interpreter = interpreter
+        self.threshold = threshold
+        self.debug = debug
+
+        interp = interpreter
+        genv, budget = interp.global_scope, interp.budget
+        def _global(token):
+            value = genv.dict.get(token.lexeme, MISSING)
+            if value is MISSING: return genv.get_or_error(token) # raises
+            return value
+        def _free(cell, token):
+            value = cell.value
+            return _global(token) if value is MISSING else value
+        def _shadowed(names):
+            # an outer binding would make an assignment write through to it, see Environment.assign
+            env = genv
+            while env is not None:
+                for name in names:
+                    if env.dict.get(name) is not None: return True
+                env = env.parent
+            return False
+        def _call(paren, callee, *args):
+            if type(callee) is not NathFunction or len(args) != callee.arity or budget is not None:
+                return interp.do_call(callee, list(args), paren) # raises, or checks the budget
+            return callee.call(*args)
+        self.helpers = {
+            '_NUM': NUMBER, '_add': interp.do_add, '_sub': interp.do_sub, '_mul': interp.do_mul,
+            '_div': interp.do_div, '_pow': interp.do_pow, '_binary': interp.do_binary,
+            '_unary': interp.do_unary, '_global': _global, '_free': _free, '_shadowed': _shadowed,
+            '_call': _call,
+            '_print': lambda value: print(value, file=interp.output),
+            '_show': lambda value: print(interp.stringify(value), file=interp.output),
+            '_iter': interp.assert_iterable, '_close': close_iterator, '_list': NathArray,
+            '_range': lambda low, high, step, dots: interp.make_range(interp.int_range(low, high, step), dots),
+            '_step': budget.step if budget is not None else None,
+            '_index': lambda target, index, bracket:
+                interp.do_index(interp.assert_indexable(target, bracket), index, bracket),
+            '_slice': lambda target, low, high, step, bracket:
+                interp.do_slice(interp.assert_indexable(target, bracket), interp.int_range(low, high, step), bracket),
+            '_setindex': interp.do_set_index,
+            '_Record': Record, '_field': interp.get_field, '_setfield': interp.do_set_field,
+        }
+
+    def compile(self, fn: NathFunction) -> bool:
+        '''Replace ``fn.call`` with a compiled version, returns False if fn has to stay interpreted'''
+        # the generated code depends on which captured cells are bound, the code object is shared
+        # between all functions with the same definition and the same bound cells
+        cells = fn.closure.dict
+        interp = self.interpreter
+        key = (tuple(sorted((name, cell.value is not MISSING) for name, cell in cells.items())),
+               interp.in_repl, interp.budget is not None)
+        with cache_lock:
+            cache = fn.definition.__dict__.setdefault('jit_cache', {})
+            if key not in cache:
+                try:
+                    cache[key] = Transpiler(fn, interp.in_repl, interp.budget is not None).translate()
+                except CannotCompile as e:
+                    cache[key] = None
+                    if self.debug: print(f"### jit: {fn} stays interpreted: {e}")
+            entry = cache[key]
+        if entry is None: return False
+
+        source, code, params = entry
+        if self.debug: print(f"### jit: compiled {fn}\n{source}")
+        namespace = {}
+        exec(code, namespace)
+        args = {}
+        for name, (kind, payload) in params.items():
+            if kind == 'helper': args[name] = self.helpers[payload]
+            elif kind == 'cell': args[name] = cells[payload]
+            else: args[name] = payload
+        args['_interpreted'] = lambda *arguments: NathFunction.call(fn, *arguments)
+        fn.call = namespace['_factory'](**args)
+        return True
+
+
+class Transpiler(Visitor):
+    '''Translates the definition of a single NathFunction to the source of a python function.
+       Visiting an expression returns python source, statements are appended to ``self.lines``.'''
+
+    def __init__(self, fn: NathFunction, in_repl=False, budget=False):
+        self.fn = fn
+        self.definition = fn.definition
+        self.in_repl = in_repl
+        self.budget = budget # emit budget steps in loops
+        self.lines = []
+        self.indent = 2
+        self.params = {}  # name of factory parameter -> (kind, payload)
+        self.n_temps = 0
+        self.loops = []   # names of enclosing each loop variables, or None for while loops
+
+    def translate(self):
+        definition, cells = self.definition, self.fn.closure.dict
+        parameters = [p.lexeme for p in definition.parameters]
+        assigned, loop_vars = LocalNames().collect(definition.body)
+        if captured := assigned & set(cells):
+            raise CannotCompile(f"assigns to captured variables {sorted(captured)}")
+        if clash := loop_vars & (assigned | set(parameters)):
+            raise CannotCompile(f"loop variables {sorted(clash)} are also assigned")
+        self.locals = assigned | set(parameters)
+        self.defined = set(parameters) # locals that are definitely assigned at this point
+
+        if assigned:
+            names = self.const(tuple(sorted(assigned)))
+            self.emit(f"if {self.helper('_shadowed')}({names}): return _interpreted({', '.join(self.local(p) for p in parameters)})")
+        self.statements(definition.body.statements)
+        self.emit("return None")
+
+        name = ''.join(c if c.isalnum() else '_' for c in (self.fn.name or 'anonymous'))
+        header = [
+            f"def _factory({', '.join(['_interpreted', *self.params])}):",
+            f"    def nath_{name}({', '.join(self.local(p) for p in parameters)}):",
+        ]
+        source = '\n'.join(header + self.lines + [f"    return nath_{name}"])
+        return source, compile(source, f"<nath jit: {self.fn}>", 'exec'), self.params
+
+    ### Helper methods
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def param(self, name, kind, payload):
+        self.params[name] = (kind, payload)
+        return name
+
+    def const(self, value):
+        return self.param(f"_k{len(self.params)}", 'const', value)
+
+    def helper(self, name):
+        return self.param(name, 'helper', name)
+
+    def temp(self):
+        self.n_temps += 1
+        return f"_t{self.n_temps}"
+
+    def local(self, name):
+        return f"v_{name}"
+
+    def statements(self, statements):
+        for stmt in statements: self.visit(stmt)
+
+    def nested(self, statements, defined=(), step=None):
+        '''Emit an indented body. Assignments inside it arent visible to the code that follows'''
+        outer_defined = self.defined
+        self.defined = outer_defined | set(defined)
+        self.indent += 1
+        n_lines = len(self.lines)
+        if step is not None and self.budget:
+            self.emit(f"{self.helper('_step')}({self.const(step)})")
+        self.statements(statements)
+        if len(self.lines) == n_lines: self.emit("pass")
+        self.indent -= 1
+        self.defined = outer_defined
+
+    def default(self, node):
+        raise CannotCompile(f"{type(node).__name__} is not supported")
+
+    ### Statements
+    def visit_Block(self, block: ast.Block):
+        self.statements(block.statements)
+
+    def visit_ExpressionStatement(self, stmt: ast.ExpressionStatement):
+        value = self.visit(stmt.expression)
+        self.emit(f"{self.helper('_show')}({value})" if self.in_repl else value)
+
+    def visit_PrintStatement(self, stmt: ast.PrintStatement):
+        self.emit(f"{self.helper('_print')}({self.visit(stmt.expression)})")
+
+    def visit_ReturnStatement(self, stmt: ast.ReturnStatement):
+        self.emit(f"return {self.visit(stmt.value) if stmt.value is not None else 'None'}")
+
+    def visit_BreakStatement(self, stmt: ast.BreakStatement):
+        if not self.loops: raise CannotCompile("break outside of a loop")
+        self.emit("break")
+
+    def visit_AssignmentStatement(self, stmt: ast.AssignmentStatement):
+        name = stmt.name.lexeme
+        if stmt.operator.type == tt.EQUAL:
+            value = self.visit(stmt.value)
+        else:
+            if name not in self.defined:
+                raise CannotCompile(f"'{stmt.operator.lexeme}' on variable '{name}' that might be unassigned")
+            value = self.binary(self.local(name), self.visit(stmt.value), stmt.operator, augmented[stmt.operator.type])
+        self.emit(f"{self.local(name)} = {value}")
+        self.defined.add(name)
+
+    def visit_NumberAssignment(self, stmt: ast.NumberAssignment):
+        name = stmt.name.lexeme
+        op_type = augmented[stmt.operator.type]
+        if name not in self.defined or op_type == tt.SLASH or (self.budget and op_type in big_ints):
+            return self.visit_AssignmentStatement(stmt)
+        self.emit(f"{self.local(name)} {arithmetic[op_type][0]}= {self.visit(stmt.value)}")
+
+    def visit_IndexAssignmentStatement(self, stmt: ast.IndexAssignmentStatement):
+        target, index = self.visit(stmt.target.target), self.visit(stmt.target.index)
+        value = self.visit(stmt.value)
+        op, bracket = self.const(stmt.operator), self.const(stmt.target.bracket)
+        self.emit(f"{self.helper('_setindex')}({target}, {index}, {value}, {op}, {bracket})")
+
+    def visit_FieldAssignmentStatement(self, stmt: ast.FieldAssignmentStatement):
+        target, value = self.visit(stmt.target.target), self.visit(stmt.value)
+        op, field = self.const(stmt.operator), self.const(stmt.target)
+        self.emit(f"{self.helper('_setfield')}({target}, {value}, {op}, {field})")
+
+    def visit_IfStatement(self, stmt: ast.IfStatement):
+        self.emit(f"if {self.visit(stmt.condition)}:")
+        self.nested(stmt.main_branch.statements)
+        if stmt.else_branch is not None:
+            self.emit("else:")
+            branch = stmt.else_branch
+            self.nested(branch.statements if isinstance(branch, ast.Block) else [branch])
+
+    def visit_WhileStatement(self, stmt: ast.WhileStatement):
+        self.emit(f"while {self.visit(stmt.condition)}:")
+        self.loops.append(None)
+        self.nested(stmt.body.statements, step=stmt.keyword)
+        self.loops.pop()
+
+    def visit_EachStatement(self, stmt: ast.EachStatement):
+        iterable = self.temp()
+        self.emit(f"{iterable} = {self.helper('_iter')}({self.visit(stmt.iterable)})")
+        self.emit("try:") # lazy iterators (ie files) are closed when the loop stops
+        self.indent += 1
+        if stmt.var_name is None:
+            self.emit(f"for _ in {iterable}:")
+            defined = []
+        else:
+            name = stmt.var_name.lexeme
+            if name in self.loops: raise CannotCompile(f"nested loops both use variable '{name}'")
+            self.emit(f"for {self.local(name)} in {iterable}:")
+            defined = [name]
+        self.loops.append(defined[0] if defined else None)
+        self.nested(stmt.body.statements, defined, step=stmt.keyword)
+        self.loops.pop()
+        self.indent -= 1
+        self.emit("finally:")
+        self.emit(f"    {self.helper('_close')}({iterable})")
+
+    ### Expressions
+    def visit_Literal(self, expr: ast.Literal):
+        if expr.value is None or type(expr.value) in (bool, int): return repr(expr.value)
+        if type(expr.value) is float and math.isfinite(expr.value): return repr(expr.value)
+        return self.const(expr.value)
+
+    def visit_Grouping(self, expr: ast.Grouping):
+        return f"({self.visit(expr.expression)})"
+
+    def visit_Variable(self, var: ast.Variable):
+        name = var.name.lexeme
+        if name in self.defined or name in self.loops:
+            return self.local(name)
+        if name in self.locals:
+            raise CannotCompile(f"variable '{name}' might be read before it is assigned")
+        cell = self.fn.closure.dict.get(name)
+        if cell is None:
+            return f"{self.helper('_global')}({self.const(var.name)})"
+        cell_name = self.param(f"_c_{name}", 'cell', name)
+        if cell.value is MISSING:
+            return f"{self.helper('_free')}({cell_name}, {self.const(var.name)})"
+        return f"{cell_name}.value" # bound cells never become unbound again
+
+    def visit_Unary(self, expr: ast.Unary):
+        value = self.visit(expr.expression)
+        if expr.operator.type == tt.NOT: return f"(not {value})"
+        t, op = self.temp(), self.const(expr.operator)
+        if expr.operator.type == tt.MINUS:
+            return f"(-{t} if type({t} := {value}) in {self.helper('_NUM')} else {self.helper('_unary')}({t}, {op}))"
+        return f"{self.helper('_unary')}({value}, {op})"
+
+    def visit_Binary(self, expr: ast.Binary):
+        left, right = self.visit(expr.left), self.visit(expr.right)
+        match expr.operator.type:
+            case tt.AND: return f"({left} and {right})"
+            case tt.OR: return f"({left} or {right})"
+            case tt.EQUAL_EQUAL: return f"({left} == {right})"
+            case tt.BANG_EQUAL: return f"({left} != {right})"
+        return self.binary(left, right, expr.operator, expr.operator.type)
+
+    # operands proven to be numbers (see src/type_inference.py) need no type checks
+    def visit_NumberUnary(self, expr: ast.NumberUnary):
+        value = self.visit(expr.expression)
+        return f"(-{value})" if expr.operator.type == tt.MINUS else value
+
+    def visit_NumberBinary(self, expr: ast.NumberBinary):
+        if expr.operator.type == tt.SLASH or (self.budget and expr.operator.type in big_ints):
+            return self.visit_Binary(expr) # still checks for zero, or the size of ints
+        left, right = self.visit(expr.left), self.visit(expr.right)
+        symbol = comparisons.get(expr.operator.type) or arithmetic[expr.operator.type][0]
+        return f"({left} {symbol} {right})"
+
+    def binary(self, left, right, operator, op_type):
+        op, num = self.const(operator), self.helper('_NUM')
+        if self.budget and op_type in big_ints: # _mul and _pow check the size of int results
+            return f"{self.helper(arithmetic[op_type][1])}({left}, {right}, {op})"
+        # operands are stored in temporaries so they are evaluated once, number literals dont need a type check
+        a = left if is_number_literal(left) else self.temp()
+        b = right if is_number_literal(right) else self.temp()
+        checks = [f"(type({t} := {src}) in {num})" for t, src in [(a, left), (b, right)] if t != src]
+        operands_are_numbers = " & ".join(checks) or "True"
+        if op_type in comparisons:
+            fast, slow = f"{a} {comparisons[op_type]} {b}", f"{self.helper('_binary')}({a}, {b}, {op})"
+        else:
+            symbol, fn = arithmetic[op_type]
+            fast, slow = f"{a} {symbol} {b}", f"{self.helper(fn)}({a}, {b}, {op})"
+            if op_type == tt.SLASH: operands_are_numbers += f" and {b}" # division by zero raises in _div
+        return f"({fast} if {operands_are_numbers} else {slow})"
+
+    def visit_InlinedCall(self, expr: ast.InlinedCall): # compiled calls are cheap already
+        return self.visit(expr.call)
+
+    def visit_FunctionCall(self, expr: ast.FunctionCall):
+        args = [self.const(expr.paren), self.visit(expr.callee)] + [self.visit(arg) for arg in expr.arguments]
+        return f"{self.helper('_call')}({', '.join(args)})"
+
+    def visit_Range(self, r: ast.Range):
+        bounds = ', '.join(self.visit(x) for x in [r.low, r.high, r.step])
+        return f"{self.helper('_range')}({bounds}, {self.const(r.dots)})"
+
+    def visit_ListLiteral(self, expr: ast.ListLiteral):
+        return f"{self.helper('_list')}([{', '.join(self.visit(e) for e in expr.elements)}])"
+
+    def visit_Index(self, expr: ast.Index):
+        target, bracket = self.visit(expr.target), self.const(expr.bracket)
+        if isinstance(expr.index, ast.Range):
+            r = expr.index
+            bounds = ', '.join(self.visit(x) for x in [r.low, r.high, r.step])
+            return f"{self.helper('_slice')}({target}, {bounds}, {bracket})"
+        return f"{self.helper('_index')}({target}, {self.visit(expr.index)}, {bracket})"
+
+    def visit_RecordLiteral(self, expr: ast.RecordLiteral):
+        shape = self.const(shape_of(name.lexeme for name in expr.names))
+        return f"{self.helper('_Record')}({shape}, [{', '.join(self.visit(v) for v in expr.values)}])"
+
+    def visit_FieldAccess(self, expr: ast.FieldAccess):
+        target, field = self.visit(expr.target), self.const(expr)
+        shape, offset = expr.cache
+        if shape is None: return f"{self.helper('_field')}({target}, {field})"
+        # the inline cache of the interpreted runs becomes a fast path for records of that shape,
+        # which is checked like the cache itself, so a shape another thread put there is fine too
+        t = self.temp()
+        return (f"({t}.values[{offset}] if type({t} := {target}) is {self.helper('_Record')} "
+                f"and {t}.shape is {self.const(shape)} else {self.helper('_field')}({t}, {field}))")
+
+
+class LocalNames(Visitor):
+    '''Names assigned to and each-loop variables in a function body'''
+    def collect(self, body: ast.Block):
+        self.assigned, self.loop_vars = set(), set()
+        self.visit(body)
+        return self.assigned, self.loop_vars
+
+    def default(self, node):
+        for value in node.__dict__.values():
+            for child in (value if isinstance(value, list) else [value]):
+                if isinstance(child, ast.AstNode): self.visit(child)
+
+    def visit_AssignmentStatement(self, stmt: ast.AssignmentStatement):
+        self.assigned.add(stmt.name.lexeme)
+        self.visit(stmt.value)
+    visit_NumberAssignment = visit_AssignmentStatement
+    def visit_EachStatement(self, stmt: ast.EachStatement):
+        if stmt.var_name: self.loop_vars.add(stmt.var_name.lexeme)
+        self.default(stmt)
+    def visit_FunctionDefinition(self, fn: ast.FunctionDefinition):
+        raise CannotCompile("nested function definitions need closures")
+    def visit_InlinedCall(self, expr: ast.InlinedCall):
+        self.visit(expr.call)
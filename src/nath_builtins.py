@@ -1,12 +1,34 @@
-import math, time
+import math, time, asyncio, functools
+from array import array
 from collections import namedtuple
 
+from src.errors import NathRuntimeError
+from src.objects import NathArray, NathIterator, NathFunction
+from src.tasks import current_task
+
 Func = namedtuple("Func", ['name', 'arity'])
 
 functions = [
     Func("cos", 1), 
     Func("sin", 1), 
-    Func("now", 0)
+    Func("now", 0),
+    Func("len", 1),
+    Func("push", 2),
+    Func("lines", 1),
+    Func("read_chunks", 2),
+    Func("sum", 1),
+    Func("prod", 1),
+    Func("min", 1),
+    Func("max", 1),
+    Func("mean", 1),
+    Func("sqrt", 1),
+    Func("exp", 1),
+    Func("log", 1),
+    Func("map", 2),
+    Func("filter", 2),
+    Func("reduce", 2),
+    Func("sleep", 1),
+    Func("read_file", 1),
 ]
 
 def _sin(x): 
@@ -14,4 +36,165 @@ def _sin(x):
 def _cos(x): 
     return math.cos(x)
 def _now():
-    return time.time()
\ No newline at end of file
+    return time.time()
+def _len(xs):
+    if not isinstance(xs, (NathArray, str)):
+        raise NathRuntimeError(-69, f"len() takes a list or string, but got {type(xs).__name__}")
+    return len(xs)
+# length of the sequence that a builtin grows, checked against the budget's max_sequence_length
+result_lengths = {
+    'push': lambda xs, value: len(xs) + 1 if isinstance(xs, NathArray) else 0,
+}
+
+def _push(xs, value):
+    if not isinstance(xs, NathArray) or xs.is_view():
+        raise NathRuntimeError(-69, f"push() takes a list (not a slice), but got {type(xs).__name__}")
+    xs.append(value)
+
+### streaming file reads, the file is opened when the loop starts and closed when it ends
+def _lines(path):
+    check_path("lines", path)
+    return NathIterator(read_lines(path), f"lines of '{path}'")
+def _read_chunks(path, n):
+    check_path("read_chunks", path)
+    if type(n) is not int or n <= 0:
+        raise NathRuntimeError(-69, f"read_chunks() takes a positive integer chunk size, but got {n}")
+    return NathIterator(read_chunks(path, n), f"chunks of '{path}'")
+
+def check_path(name, path):
+    if not isinstance(path, str):
+        raise NathRuntimeError(-69, f"{name}() takes a file path string, but got {type(path).__name__}")
+
+def open_file(path):
+    try: return open(path, encoding='utf-8')
+    except OSError as e: raise NathRuntimeError(-69, f"Can't open '{path}': {e.strerror}")
+
+def read_lines(path):
+    with open_file(path) as f:
+        for line in f: yield line[:-1] if line.endswith('\n') else line
+
+def read_chunks(path, n):
+    with open_file(path) as f:
+        while chunk := f.read(n): yield chunk
+
+### waiting, in the async runtime the other tasks run meanwhile (see src/tasks.py), otherwise it blocks
+def _sleep(seconds):
+    if type(seconds) not in NUMBER_TYPES or seconds < 0:
+        raise NathRuntimeError(-69, f"sleep() takes a number of seconds >= 0, but got {seconds}")
+    task = current_task()
+    if task is None: time.sleep(seconds)
+    else: task.wait(asyncio.sleep(seconds))
+def _read_file(path):
+    check_path("read_file", path)
+    task = current_task()
+    if task is None: return read_file(path)
+    return task.wait(asyncio.to_thread(read_file, path)) # asyncio has no async files, so on a worker thread
+
+def read_file(path):
+    with open_file(path) as f: return f.read()
+
+### aggregates over lists, ranges, strings and iterators. the loops run in C (sum, math.fsum, min, 
+### map, ...), unboxed int and float lists skip the element type checks
+def _sum(xs):
+    values = numbers("sum", xs)
+    if type(values) is list: exact = all_ints(values)
+    else: exact = values.typecode == 'q'
+    return sum(values) if exact else math.fsum(values) # ints stay exact
+def _prod(xs):
+    return math.prod(numbers("prod", xs))
+def _mean(xs):
+    values = numbers("mean", xs)
+    if not values: raise NathRuntimeError(-69, "mean() of an empty sequence")
+    return math.fsum(values) / len(values)
+def _min(xs):
+    return extreme("min", min, xs)
+def _max(xs):
+    return extreme("max", max, xs)
+
+def elements(name, xs, live=False):
+    '''The elements of ``xs`` in a list, or its unboxed storage if it has one. ``live`` gives an
+       array itself, for callbacks that can store into it while it's iterated'''
+    if type(xs) is NathArray:
+        if live: return xs
+        return xs.items if not xs.is_view() else list(xs)
+    if isinstance(xs, (str, NathIterator)): return list(xs)
+    raise NathRuntimeError(-69, f"{name}() takes a list, range, string or iterator, but got {type(xs).__name__}")
+
+def numbers(name, xs):
+    values = elements(name, xs)
+    if type(values) is list and not set(map(type, values)) <= NUMBER_TYPES:
+        raise NathRuntimeError(-69, f"{name}() takes a sequence of numbers")
+    return values
+
+NUMBER_TYPES = {int, float} # exact, bools are not numbers
+
+def all_ints(values):
+    return set(map(type, values)) <= {int}
+
+def extreme(name, f, xs):
+    values = elements(name, xs)
+    if not values: raise NathRuntimeError(-69, f"{name}() of an empty sequence")
+    if type(values) is list:
+        types = set(map(type, values))
+        if not (types <= NUMBER_TYPES or types == {str}):
+            raise NathRuntimeError(-69, f"{name}() takes a sequence of only numbers or only strings")
+    return f(values)
+
+### elementwise math, on a number or on every element of a sequence
+def _sqrt(x):
+    return elementwise("sqrt", math.sqrt, x)
+def _exp(x):
+    return elementwise("exp", math.exp, x)
+def _log(x):
+    return elementwise("log", math.log, x)
+
+def elementwise(name, f, x):
+    try:
+        if type(x) in NUMBER_TYPES: return f(x)
+        result = NathArray()
+        result.items = array('d', map(f, numbers(name, x)))
+        return result
+    except ValueError: raise NathRuntimeError(-69, f"{name}() argument out of domain")
+    except OverflowError: raise NathRuntimeError(-69, f"{name}() result too large")
+
+### higher order functions, the callback goes through Interpreter.do_call like a call in a script
+def _map(f, xs):
+    if type(xs) is NathIterator: # stays lazy
+        return NathIterator(map(callback("map", f, 1), xs), f"map of {xs.name}")
+    values = elements("map", xs, live=True)
+    return NathArray(list(map(callback("map", f, 1, len(values)), values)))
+def _filter(f, xs):
+    if type(xs) is NathIterator:
+        keep = callback("filter", f, 1)
+        truthy = truthiness(f)
+        return NathIterator((x for x in xs if truthy(keep(x))), f"filter of {xs.name}")
+    values = elements("filter", xs, live=True)
+    keep = callback("filter", f, 1, len(values))
+    truthy = truthiness(f) # the same rule as an if statement
+    kept = [x for x in values if truthy(keep(x))]
+    if type(xs) is str: return "".join(kept)
+    return NathArray(kept)
+def _reduce(f, xs):
+    values = elements("reduce", xs, live=True)
+    if not values: raise NathRuntimeError(-69, "reduce() of an empty sequence")
+    return functools.reduce(callback("reduce", f, 2, len(values) - 1), values)
+
+def callback(name, f, arity, calls=None):
+    '''The python function to call ``f`` with, through do_call so the budget and the stats count
+       the calls. If ``f`` will get hot during the ``calls`` calls it's compiled up front, so the
+       loop doesn't keep calling the interpreted version.'''
+    if type(f) is not NathFunction:
+        raise NathRuntimeError(-69, f"{name}() takes a function, but got {type(f).__name__}")
+    if f.arity != arity:
+        raise NathRuntimeError(-69, f"{name}() takes a function of {arity} arguments, but {f} takes {f.arity}")
+    interpreter = f.interpreter
+    if interpreter is None: return f.call # builtin
+    jit = interpreter.jit
+    if calls is not None and jit and 'call' not in f.__dict__ and f.call_count < jit.threshold <= f.call_count + calls:
+        f.call_count = jit.threshold
+        jit.compile(f)
+    do_call = interpreter.do_call
+    return lambda *args: do_call(f, list(args)) # picks up the compiled version when there is one
+
+def truthiness(f):
+    return f.interpreter.is_truthy if f.interpreter is not None else bool
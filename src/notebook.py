@@ -0,0 +1,126 @@
+import dataclasses
+from difflib import SequenceMatcher
+
+from src import scanner, parser, interpreter
+from src.tokens import Token
+from src.errors import NathError
+from src.objects import NathFunction
+from src.resolver import FreeVariables
+from src.inliner import Inliner, children
+import src.ast_nodes as ast
+
+class Notebook():
+    '''Runs a script again after it was edited, but only the top level statements that changed
+       and the ones that depend on them, ie
+
+           notebook = Notebook()
+           notebook.update(source)         # runs everything
+           notebook.update(edited_source)  # runs the edited statements and their dependents
+
+       Globals of the statements that don't run keep their values from the last run. A statement
+       runs again if it changed, or if it reads or writes a global that a statement which runs (or
+       was removed) writes. Reads include the globals read by the functions a statement can call.
+       Statements with calls, index assignments or each-loops also count as writing the lists and
+       other mutable values they read, since they might modify them.'''
+
+    def __init__(self, **interpreter_options):
+        self.interpreter = interpreter.Interpreter(**interpreter_options)
+        self.free_variables = FreeVariables()
+        self.keys = []    # of the statements of the last version, unique objects if they havent run
+        self.writes = []  # global names each of those statements writes
+
+    def update(self, source: str) -> list[int]:
+        '''Run the parts of ``source`` that changed since the last update, returns the numbers of
+           the statements that ran. Raises NathSyntaxError and NathRuntimeError, the statement that
+           failed and the ones after it run again on the next update.'''
+        statements = parser.Parser().parse(scanner.Scanner(source).scan_tokens())
+        keys = [statement_key(stmt) for stmt, _ in statements]
+        unchanged, removed = [False] * len(keys), [True] * len(self.keys)
+        for block in SequenceMatcher(None, self.keys, keys, autojunk=False).get_matching_blocks():
+            for k in range(block.size):
+                removed[block.a + k], unchanged[block.b + k] = False, True
+
+        values = self.interpreter.global_scope.dict
+        reads = [self.reads(stmt, values) for stmt, _ in statements]
+        writes = [self.assigned(stmt, r, values) for (stmt, _), r in zip(statements, reads)]
+        dirty = set()
+        for i, is_removed in enumerate(removed):
+            if is_removed: dirty |= self.writes[i]
+        for i, is_unchanged in enumerate(unchanged):
+            if not is_unchanged: dirty |= writes[i]
+        # globals that only removed statements defined are gone
+        for name in dirty.difference(*writes):
+            if name in interpreter.BUILTINS: values[name] = interpreter.BUILTINS[name]
+            else: values.pop(name, None)
+
+        Inliner().inline(statements)
+        self.keys, self.writes = keys, writes
+        ran = []
+        for i, runs in enumerate(self.plan(dirty, unchanged, reads, writes)):
+            if not runs: continue
+            stmt, num = statements[i]
+            try: self.interpreter.interpret([(stmt, num)])
+            except NathError:
+                self.keys[i:] = [object() for _ in keys[i:]]
+                raise
+            ran.append(num)
+        return ran
+
+    def plan(self, dirty: set, unchanged: list, reads: list, writes: list) -> list[bool]:
+        '''Which statements run: the changed ones and the ones that read or write a global that a
+           statement before them which runs (or was removed) writes. A statement that updates a
+           global in place (ie push(xs, 1) or x += 1) would update the value of the last run again,
+           so the statements before it that write that global run too.'''
+        runs = [not u for u in unchanged]
+        while True:
+            written, writers, earlier = set(dirty), {}, set()
+            for i in range(len(runs)):
+                if not runs[i] and not (written.isdisjoint(reads[i]) and written.isdisjoint(writes[i])):
+                    runs[i] = True
+                if runs[i]:
+                    written |= writes[i]
+                    for name in reads[i] & writes[i]: earlier.update(j for j in writers.get(name, ()) if not runs[j])
+                for name in writes[i]: writers.setdefault(name, []).append(i)
+            if not earlier: return runs
+            for j in earlier: runs[j] = True
+
+    def reads(self, stmt, values: dict) -> set:
+        '''Globals ``stmt`` reads, and the ones read by the functions it reads (transitively)'''
+        names = set(self.free_variables.visit(stmt))
+        pending = list(names)
+        while pending:
+            value = values.get(pending.pop())
+            if type(value) is NathFunction and value.definition is not None:
+                for name in self.free_variables.free_names(value.definition):
+                    if name not in names:
+                        names.add(name)
+                        pending.append(name)
+        return names
+
+    def assigned(self, stmt, reads: set, values: dict) -> set:
+        # assignments in function bodies count too, they write to globals that exist already
+        names, may_mutate = set(), False
+        def visit(node):
+            nonlocal may_mutate
+            if isinstance(node, ast.AssignmentStatement): names.add(node.name.lexeme)
+            elif isinstance(node, ast.EachStatement):
+                may_mutate = True # ie consumes an iterator
+                if node.var_name: names.add(node.var_name.lexeme)
+            elif isinstance(node, (ast.FunctionCall, ast.IndexAssignmentStatement, ast.FieldAssignmentStatement)):
+                may_mutate = True
+            for child in children(node): visit(child)
+        visit(stmt)
+        if may_mutate: names.update(name for name in reads if is_mutable(values.get(name)))
+        return names
+
+
+def is_mutable(value):
+    return value is not None and type(value) not in (int, float, bool, str, NathFunction)
+
+def statement_key(node):
+    '''Equal for statements that are the same apart from their position (line numbers)'''
+    if isinstance(node, Token): return (node.type, node.lexeme)
+    if isinstance(node, ast.AstNode):
+        return (type(node).__name__,) + tuple(statement_key(getattr(node, f.name)) for f in dataclasses.fields(node))
+    if isinstance(node, list): return tuple(statement_key(v) for v in node)
+    return (type(node).__name__, repr(node))
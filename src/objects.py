@@ -1,5 +1,17 @@
+from array import array
+from itertools import islice
+from collections.abc import Iterator
+
 from src.ast_nodes import FunctionDefinition
-from src.environment import Environment
+from src.environment import Environment, LoopScope
+from src.visitor import Visitor
+from src.resolver import yielding_nodes
+from src.inliner import returned_expression
+from src.shapes import Shape, shape_of
+
+# numeric types, ints are promoted to floats when mixed with them (bools are not numbers)
+NUMBER = (int, float)
+NUMBER_TYPES = frozenset(NUMBER)
 
 class Return(Exception):
     def __init__(self, value):
@@ -14,21 +26,261 @@ class NathFunction():
         self.definition = definition
         self.closure = closure
         if definition: self.arity = len(definition.parameters)
+        # returned expression of one-line functions like x -> 2x
+        self.expression = returned_expression(definition.body) if definition else None
+        # body without operand checks, for calls with only number arguments (see src/type_inference.py)
+        self.number_body = definition.number_body if definition else None
+        if self.number_body is not None: self.number_expression = returned_expression(self.number_body)
+        self.is_generator = definition is not None and bool(yielding_nodes(definition))
         self.name = name
+        self.call_count = 0
 
     def call(self, *arguments):
         #print("in call,", arguments)
+        self.call_count += 1
+        jit = self.interpreter.jit
+        if jit and self.call_count == jit.threshold and not self.is_generator and jit.compile(self):
+            return self.call(*arguments) # replaced by the compiled version
+
         env = Environment(parent=self.closure)
         for param, arg in zip(self.definition.parameters, arguments):
             env.define(param.lexeme, arg)
+        if self.is_generator: # the body runs as the result is looped over
+            return NathIterator(Generator(self, env).run(), f"generator {self.name or 'function'}")
 
         #print("environment:", env.dict, "parent:", env.parent.dict)
 
+        body, expression = self.definition.body, self.expression
+        if self.number_body is not None and NUMBER_TYPES.issuperset(map(type, arguments)):
+            body, expression = self.number_body, self.number_expression
+        if expression is not None: # no need for a block and a Return exception
+            interpreter = self.interpreter
+            prev_env, interpreter.env = interpreter.env, env
+            try: return interpreter.evaluate(expression)
+            finally: interpreter.env = prev_env
         try: 
-            self.interpreter.evaluate(self.definition.body, block_env=env)
+            self.interpreter.evaluate(body, block_env=env)
         except Return as r:
             return r.value
     
     def __repr__(self):
         if self.name: return f"function '{self.name}'"
         else: return "anonymous function"
+
+
+def compact_storage(values):
+    '''Store homogeneous ints or floats unboxed in an ``array``, anything else in a list'''
+    if isinstance(values, range) or (values and all(type(v) is int for v in values)):
+        try: return array('q', values)
+        except OverflowError: return list(values) # bigger than 64 bits
+    if values and all(type(v) is float for v in values):
+        return array('d', values)
+    return list(values)
+
+def fits_storage(items, value):
+    if type(items) is list: return True
+    if items.typecode == 'd': return type(value) is float
+    return type(value) is int and -2**63 <= value < 2**63
+
+class NathArray():
+    '''Growable sequence of values. A slice is a view (``base``, ``start``, ``step``, ``length``) 
+       into the storage of its base array, so slicing never copies and writes to a slice are 
+       visible in the base. Only base arrays can grow.'''
+    __slots__ = ('base', 'items', 'start', 'step', 'length')
+
+    def __init__(self, values=(), base=None, start=0, step=1, length=0):
+        if base is None:
+            self.base, self.items = self, compact_storage(values)
+        else:
+            self.base, self.items = base, None
+        self.start, self.step, self.length = start, step, length
+
+    def is_view(self):
+        return self.base is not self
+
+    def __len__(self):
+        return self.length if self.is_view() else len(self.items)
+
+    def __iter__(self):
+        if not self.is_view(): # a list is only replaced while it's empty, see append
+            return iter(self.items) if type(self.items) is list else self.iterate()
+        stop = self.start + self.length * self.step
+        base = self.base # reads the storage of the base every time, it can be replaced meanwhile
+        return (base.items[i] for i in range(self.start, stop, self.step))
+
+    def iterate(self):
+        '''Like iterating a python list, sees writes and appends while the loop runs, also when
+           they move the elements to boxed storage (see box)'''
+        items, i = self.items, 0
+        while True:
+            last = i - 1
+            for last, value in enumerate(islice(items, i, None), i): yield value
+            if self.items is items: return
+            items, i = self.items, last + 1
+
+    def position(self, i):
+        '''Position of element i in the base storage, or None if out of bounds'''
+        if not 0 <= i < len(self): return None
+        return self.start + i * self.step
+
+    def get(self, i):
+        return self.base.items[self.position(i)]
+
+    def set(self, i, value):
+        base = self.base
+        if not fits_storage(base.items, value): base.box() # mixed types
+        base.items[self.position(i)] = value
+
+    def append(self, value):
+        '''Amortized O(1), both array and list over-allocate when growing'''
+        if type(self.items) is list and not self.items:
+            self.items = compact_storage([value])
+            return
+        if not fits_storage(self.items, value): self.box()
+        self.items.append(value)
+
+    def box(self):
+        '''Move the elements to a list, which holds any value. The old storage is emptied, so
+           the loops over it stop and go on in the new one'''
+        items = self.items
+        self.items = list(items)
+        del items[:]
+
+    def slice(self, indices: range):
+        '''View of the elements at ``indices`` (which must all be in bounds)'''
+        return NathArray(base=self.base, start=self.start + indices.start * self.step, 
+                         step=self.step * indices.step, length=len(indices))
+
+    def __eq__(self, other):
+        if not isinstance(other, NathArray) or len(self) != len(other): return False
+        return all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return "[" + ", ".join(format_element(v) for v in self) + "]"
+
+def format_element(v):
+    if v is None: return "null"
+    if v is True: return "true"
+    if v is False: return "false"
+    if isinstance(v, str): return f'"{v}"'
+    return repr(v)
+
+
+class Record():
+    '''Value with named fields, ie {x: 1, y: 2}. The values are stored in a list in the order of
+       the fields of its shape, assigning a new field moves the record to a bigger shape.'''
+    __slots__ = ('shape', 'values')
+
+    def __init__(self, shape: Shape, values: list):
+        self.shape = shape
+        self.values = values
+
+    def add_field(self, name: str, value):
+        self.shape = self.shape.with_field(name)
+        self.values.append(value)
+
+    def as_dict(self) -> dict:
+        return dict(zip(self.shape.names, self.values))
+
+    def __eq__(self, other):
+        if not isinstance(other, Record): return False
+        if self.shape is other.shape: return self.values == other.values
+        return self.as_dict() == other.as_dict() # same fields in another order
+
+    def __repr__(self):
+        return "{" + ", ".join(f"{name}: {format_element(v)}" for name, v in self.as_dict().items()) + "}"
+
+
+class NathIterator():
+    '''A lazy sequence that can be looped over once, ie the lines of a file. An each-loop 
+       closes it when it stops (including on break and errors), which closes the file.'''
+    def __init__(self, iterator: Iterator, name='iterator'):
+        self.iterator = iterator
+        self.name = name
+
+    def __iter__(self): # the loop uses the generator directly, so no python call per element
+        return self.iterator
+
+    def __next__(self):
+        return next(self.iterator)
+
+    def close(self):
+        close_iterator(self.iterator)
+
+    def __repr__(self):
+        return self.name
+
+def close_iterator(iterable):
+    if isinstance(iterable, Iterator):
+        close = getattr(iterable, 'close', None)
+        if close is not None: close()
+
+
+class Generator(Visitor):
+    '''Runs the body of a generator function as a python generator, that stops at every yield and
+       continues from there when the next element is asked for. Only the statements that contain
+       a yield are run by this visitor, the rest (and all expressions) by the interpreter, so
+       there's no thread or interpreter per generator and it uses constant memory.'''
+    def __init__(self, fn: NathFunction, env: Environment):
+        self.interpreter = fn.interpreter
+        self.body = fn.definition.body
+        self.yielding = yielding_nodes(fn.definition)
+        self.env = env # the scope the generator is at while it's paused
+
+    def run(self):
+        interp = self.interpreter
+        steps = self.execute(self.body)
+        try:
+            while True:
+                prev_env, interp.env = interp.env, self.env
+                try: value = next(steps)
+                except (StopIteration, Return): return # a return ends the generator, its value is ignored
+                finally: self.env, interp.env = interp.env, prev_env
+                yield value
+        finally: # closed by a break in the loop over it, run the finally blocks of its own loops
+            prev_env, interp.env = interp.env, self.env
+            try: steps.close()
+            finally: interp.env = prev_env
+
+    def execute(self, stmt):
+        if id(stmt) not in self.yielding:
+            self.interpreter.evaluate(stmt)
+            return ()
+        return self.visit(stmt)
+
+    def visit_Block(self, block):
+        for stmt in block.statements: yield from self.execute(stmt)
+
+    def visit_YieldStatement(self, stmt):
+        yield self.interpreter.evaluate(stmt.value)
+
+    def visit_IfStatement(self, stmt):
+        interp = self.interpreter
+        if interp.is_truthy(interp.evaluate(stmt.condition)):
+            yield from self.execute(stmt.main_branch)
+        elif stmt.else_branch is not None:
+            yield from self.execute(stmt.else_branch)
+
+    def visit_WhileStatement(self, stmt):
+        interp, budget = self.interpreter, self.interpreter.budget
+        try:
+            while interp.is_truthy(interp.evaluate(stmt.condition)):
+                if budget is not None: budget.step(stmt.keyword)
+                yield from self.execute(stmt.body)
+        except Break: pass
+
+    def visit_EachStatement(self, stmt):
+        interp, budget = self.interpreter, self.interpreter.budget
+        iterable = interp.assert_iterable(interp.evaluate(stmt.iterable))
+        loop_scope = LoopScope(parent=interp.env)
+        prev_env, interp.env = interp.env, loop_scope
+        try:
+            for elem in iterable:
+                if budget is not None: budget.step(stmt.keyword)
+                if stmt.var_name:
+                    loop_scope.bind(stmt.var_name.lexeme, elem)
+                yield from self.execute(stmt.body)
+        except Break: pass
+        finally:
+            interp.env = prev_env
+            close_iterator(iterable)
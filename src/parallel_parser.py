@@ -0,0 +1,96 @@
+'''Scans and parses big sources in pieces on a process pool. The source is split at newlines
+   outside of any (), [] or {} and outside of strings and comments (and not before an 'else'),
+   which is always between two top level statements, so the pieces parse the same way as they
+   would as part of the whole source. The result, including the errors, is the same as
+
+       parser.Parser().parse(scanner.Scanner(source).scan_tokens())
+'''
+import os, re
+from concurrent.futures import ProcessPoolExecutor
+
+from src import scanner, parser
+from src.errors import NathSyntaxError
+
+# smaller sources aren't worth starting processes for
+PARALLEL_THRESHOLD = 1_000_000 # characters
+PIECES_PER_PROCESS = 4
+
+# strings have no escapes, an unclosed string matches until the end of the source
+interesting = re.compile(r'"[^"]*"?|#[^\n]*|[(\[{]|[)\]}]|\n')
+skippable = re.compile(r'(?:[ \t\r\n]|#[^\n]*)*')
+else_keyword = re.compile(r'(?:else|elseif)(?![\w])')
+
+def parse(source: str, processes: int=1) -> list:
+    '''Parse ``source`` on ``processes`` processes (None for one per core), or serially if it's
+       small. Serial by default: the workers send the syntax trees back pickled, and unpickling
+       them costs about as much as parsing, so the pool hasn't been faster on any machine we
+       measured (see tools/parallel_parse_bench.py)'''
+    if processes is None: processes = os.cpu_count() or 1
+    if processes == 1 or len(source) < PARALLEL_THRESHOLD: return parse_piece(source)
+    pieces = split(source, processes * PIECES_PER_PROCESS)
+    if len(pieces) == 1: return parse_piece(source)
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(parse_piece_safely, pieces))
+    return merge(pieces, results)
+
+def split(source: str, n_pieces: int) -> list[tuple[str, int]]:
+    '''Pieces of about len(source) / n_pieces characters, with the line number they start on.
+       Returns the whole source as one piece if its brackets or strings arent closed.'''
+    piece_size = max(1, len(source) // n_pieces)
+    starts, depth, next_split = [0], 0, piece_size
+    first_code = skippable.match(source).end() # every piece needs a statement
+    for match in interesting.finditer(source):
+        token = match.group()
+        if token == '\n':
+            if depth == 0 and match.end() >= next_split and match.start() > first_code:
+                start = skippable.match(source, match.end()).end()
+                if start < len(source) and not else_keyword.match(source, start):
+                    starts.append(start)
+                    next_split = start + piece_size
+        elif token in '([{': depth += 1
+        elif token in ')]}':
+            depth -= 1
+            if depth < 0: return [(source, 1)]
+        elif token[0] == '"' and (len(token) == 1 or token[-1] != '"'): return [(source, 1)]
+    if depth != 0: return [(source, 1)]
+
+    pieces, line = [], 1
+    for start, end in zip(starts, starts[1:] + [len(source)]):
+        pieces.append((source[start:end], line))
+        line += source.count('\n', start, end)
+    return pieces
+
+def parse_piece(source: str, line=1, inside_function_body=0, inside_each_or_while=0):
+    tokens = scanner.Scanner(source, line).scan_tokens()
+    return parser.Parser().parse(tokens, inside_function_body, inside_each_or_while)
+
+def parse_piece_safely(piece):
+    '''Runs in the worker processes, errors are returned so the merge can report the right one'''
+    source, line = piece
+    try: tokens = scanner.Scanner(source, line).scan_tokens()
+    except NathSyntaxError as e: return 'scan', e
+    piece_parser = parser.Parser()
+    try: statements = piece_parser.parse(tokens)
+    except NathSyntaxError as e: return 'parse', e
+    return 'ok', (statements, piece_parser.inside_function_body, piece_parser.inside_each_or_while)
+
+def merge(pieces, results) -> list:
+    # the whole source is scanned before parsing, so the first scan error wins over parse errors
+    for kind, result in results:
+        if kind == 'scan': raise result
+    statements, inside_function_body, inside_each_or_while = [], 0, 0
+    for (source, line), (kind, result) in zip(pieces, results):
+        if kind == 'parse':
+            if not (inside_function_body or inside_each_or_while): raise result
+            # the parser allows return and break after any function or loop, parse it again knowing that
+            piece_parser = parser.Parser()
+            piece_statements = piece_parser.parse(scanner.Scanner(source, line).scan_tokens(),
+                                                  inside_function_body, inside_each_or_while)
+            result = (piece_statements, piece_parser.inside_function_body - inside_function_body,
+                      piece_parser.inside_each_or_while - inside_each_or_while)
+        piece_statements, in_functions, in_loops = result
+        offset = len(statements) # statements are numbered in order
+        statements.extend((stmt, num + offset) for stmt, num in piece_statements)
+        inside_function_body += in_functions
+        inside_each_or_while += in_loops
+    return statements
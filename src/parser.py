@@ -2,306 +2,400 @@ from src.errors import NathSyntaxError
 import src.ast_nodes as ast
 from src.tokens import Token, TokenType as tt
 
+# precedence of the left associative binary operators, higher binds tighter. Their operands are
+# parsed by unary_left, ie prefix -/+, implicit multiplication, '^' and postfix '!'
+BINARY_PRECEDENCE = {
+    tt.AND: 1, tt.OR: 1,
+    tt.EQUAL_EQUAL: 2, tt.BANG_EQUAL: 2,
+    tt.GT: 3, tt.GT_EQUAL: 3, tt.LT: 3, tt.LT_EQUAL: 3,
+    tt.PLUS: 4, tt.MINUS: 4,
+    tt.STAR: 5, tt.SLASH: 5,
+}
+MAX_PRECEDENCE = max(BINARY_PRECEDENCE.values())
+
+PREFIX_OPERATORS = frozenset([tt.MINUS, tt.PLUS])
+ASSIGNMENT_OPERATORS = frozenset([tt.EQUAL, tt.STAR_EQUAL, tt.SLASH_EQUAL, tt.MINUS_EQUAL, tt.PLUS_EQUAL, tt.CARET_EQUAL])
+STATEMENT_ENDS = frozenset([tt.NEWLINE, tt.EOF, tt.SEMICOLON])
+LITERALS = {tt.TRUE: True, tt.FALSE: False, tt.NULL: None}
+
 class Parser():
     def __init__(self):
         self.ignore_undefined = False
-    
-    def parse(self, tokens: list[Token]) -> list:
-        '''Recursively parse self.tokens and return a list of statements.'''
+
+    def parse(self, tokens: list[Token], inside_function_body=0, inside_each_or_while=0) -> list:
+        '''Recursively parse self.tokens and return a list of statements. The counters are for
+           parsing the rest of a source after a piece of it, see src/parallel_parser.py'''
         self.tokens = tokens
+        self.n_tokens = len(tokens)
         self.current = 0
         statements = []
         self.line_num = 0
-        self.inside_function_body = 0
-        self.inside_each_or_while = 0
+        self.inside_function_body = inside_function_body
+        self.inside_each_or_while = inside_each_or_while
         while not self.is_at_end():
             self.line_num += 1
             statements.append((self.statement(), self.line_num))
-            self.match([tt.EOF])
+            self.match(tt.EOF)
         return statements
-    
+
     ### Helper methods
     def is_at_end(self):
-        return self.current >= len(self.tokens)
-    
+        return self.current >= self.n_tokens
+
     def advance(self):
         if not self.is_at_end(): self.current += 1
         return self.previous()
-    
+
     def previous(self):
         return self.tokens[self.current - 1]
-    
+
     def peek(self):
         if self.is_at_end(): return Token(tt.EOF)
         return self.tokens[self.current]
-    
-    def match(self, token_types: list[str], consume=True):
-        next_token = self.peek()
-        if any([next_token.istype(t) for t in token_types]):
-            return self.advance() if consume else True
+
+    def type_at(self, i):
+        return self.tokens[i].type if i < self.n_tokens else tt.EOF
+
+    def match(self, token_type: str):
+        '''Consume and return the next token if it has type ``token_type``'''
+        if self.current < self.n_tokens and self.tokens[self.current].type == token_type:
+            self.current += 1
+            return self.tokens[self.current - 1]
         return None
 
-    def has_to_match(self, token_types: list[str], error_msg: str, consume=True):
-        token = self.match(token_types, consume)
+    def has_to_match(self, token_type: str, error_msg: str):
+        token = self.match(token_type)
         if not token:
             raise NathSyntaxError(self.peek(), error_msg) # stop parsing
         else: return token
-    
+
     def is_number(self, expr: ast.AstNode):
-        if isinstance(expr, ast.Literal) and isinstance(expr.value, float): 
-            return True 
+        if isinstance(expr, ast.Literal) and type(expr.value) in (int, float): # not bool
+            return True
         return False
-    
+
     def consume_newlines(self):
-        while self.match([tt.NEWLINE]): pass # ignore empty lines
-    
-    ### Recursive descent methods
+        while self.match(tt.NEWLINE): pass # ignore empty lines
+
+    ### Statements
     def statement(self):
         self.consume_newlines()
 
-        if self.match([tt.PRINT]):
-            stmt = self.print_statement()
-        elif self.match([tt.LEFT_BRACE]):
-            stmt = self.block()
-        elif self.match([tt.EACH]):
-            stmt = self.each_statement()
-        elif self.match([tt.WHILE]):
-            stmt = self.while_statement()
-        elif self.match([tt.IF]):
-            stmt = self.if_statement()
-        elif self.match([tt.RETURN]):
-            stmt = self.return_statement()
-        elif self.match([tt.BREAK]):
-            stmt = self.break_statement()
-        elif self.match([tt.CONTINUE]):
-            stmt = self.continue_statement()
+        parse_statement = self.KEYWORD_STATEMENTS.get(self.type_at(self.current))
+        if parse_statement is not None:
+            self.current += 1
+            stmt = parse_statement(self)
         else:
             stmt = self.assignment_or_expression_statement()
-        
-        if not self.peek().type in [tt.RIGHT_BRACE]:
-            self.has_to_match([tt.NEWLINE, tt.EOF, tt.SEMICOLON], 
-                f"Excpected end of statement (newline or ';'), but got {self.peek().lexeme}")
+
+        if self.type_at(self.current) != tt.RIGHT_BRACE:
+            if self.type_at(self.current) not in STATEMENT_ENDS:
+                raise NathSyntaxError(self.peek(),
+                    f"Excpected end of statement (newline or ';'), but got {self.peek().lexeme}")
+            self.current += 1
 
         self.consume_newlines()
         return stmt
-    
+
     def block(self):
         statements = []
-        while not (self.is_at_end() or self.peek().istype(tt.RIGHT_BRACE)):
+        while not (self.is_at_end() or self.type_at(self.current) == tt.RIGHT_BRACE):
             statements.append(self.statement())
-        self.has_to_match([tt.RIGHT_BRACE], "Brace mismatch")
+        self.has_to_match(tt.RIGHT_BRACE, "Brace mismatch")
         return ast.Block(statements)
-    
+
     def each_statement(self):
+        keyword = self.previous()
         var_name = self.expression()
-        if self.match([tt.OF]):
+        if self.match(tt.OF):
             iterable = self.expression()
             if not isinstance(var_name, ast.Variable):
                 raise NathSyntaxError(var_name, f"Invalid variable name in each-statement")
             var_name = var_name.name
         else: var_name, iterable = None, var_name
-        
-        self.has_to_match([tt.LEFT_BRACE], "Excpected '{ after each-statement")
+
+        self.has_to_match(tt.LEFT_BRACE, "Excpected '{ after each-statement")
         self.inside_each_or_while += 1
         body = self.block()
         self.inside_each_or_while += 1
-        return ast.EachStatement(var_name, iterable, body)
-    
+        return ast.EachStatement(var_name, iterable, body, keyword)
+
     def if_statement(self):
         condition = self.expression()
-        self.has_to_match([tt.LEFT_BRACE], "Excpected '{' after if-statement")
+        self.has_to_match(tt.LEFT_BRACE, "Excpected '{' after if-statement")
         main_branch = self.block()
 
         # skip ahead to try to find 'else' or 'elseif'
         before_newlines_ref = self.current
-        self.consume_newlines() 
+        self.consume_newlines()
 
-        if self.match([tt.ELSEIF]):
+        if self.match(tt.ELSEIF):
             else_branch = self.if_statement()
-        elif self.match([tt.ELSE]):
-            self.has_to_match([tt.LEFT_BRACE], "Excpected '{' after elseif-statement")
+        elif self.match(tt.ELSE):
+            self.has_to_match(tt.LEFT_BRACE, "Excpected '{' after elseif-statement")
             else_branch = self.block()
-        else: 
+        else:
             self.current = before_newlines_ref # if we skipped newlines earlier, go back
             else_branch = None
         return ast.IfStatement(condition, main_branch, else_branch)
-    
+
     def while_statement(self):
+        keyword = self.previous()
         condition = self.expression()
-        self.has_to_match([tt.LEFT_BRACE], "Excpected '{' after while-statement")
+        self.has_to_match(tt.LEFT_BRACE, "Excpected '{' after while-statement")
         self.inside_each_or_while += 1
         body = self.block()
         self.inside_each_or_while += 1
-        return ast.WhileStatement(condition, body)
-            
-    def print_statement(self):        
+        return ast.WhileStatement(condition, body, keyword)
+
+    def print_statement(self):
         return ast.PrintStatement(self.expression())
-    
+
     def assignment_or_expression_statement(self):
         expr = self.expression()
-        operator = self.match([tt.EQUAL, tt.STAR_EQUAL, tt.SLASH_EQUAL, tt.MINUS_EQUAL, tt.PLUS_EQUAL, tt.CARET_EQUAL])
-        if operator is not None: return self.assignment_statement(expr, operator)
+        if self.type_at(self.current) in ASSIGNMENT_OPERATORS:
+            return self.assignment_statement(expr, self.advance())
         return ast.ExpressionStatement(expr)
-    
+
     def assignment_statement(self, expr, operator):
-        if not isinstance(expr, ast.Variable): 
+        if isinstance(expr, ast.Index):
+            if isinstance(expr.index, ast.Range):
+                raise NathSyntaxError(operator, f"Can't assign to a slice")
+            return ast.IndexAssignmentStatement(expr, operator, self.expression())
+        if isinstance(expr, ast.FieldAccess):
+            return ast.FieldAssignmentStatement(expr, operator, self.expression())
+        if not isinstance(expr, ast.Variable):
             raise NathSyntaxError(operator, f"Assignment target is not a valid variable name")
         value = self.expression()
         return ast.AssignmentStatement(expr.name, operator, value)
-    
+
     def return_statement(self):
         if not self.inside_function_body:
             raise NathSyntaxError(self.peek(), "Return statement outside of function body")
-        if self.match([tt.NEWLINE, tt.SEMICOLON, tt.EOF], consume=False): value = None
+        if self.type_at(self.current) in STATEMENT_ENDS: value = None
         else: value = self.expression()
         return ast.ReturnStatement(value)
-    
+
     def break_statement(self):
         if not self.inside_each_or_while:
             raise NathSyntaxError(self.peek(), "Break statement outside each or while loop")
         return ast.BreakStatement()
-    
+
+    def yield_statement(self):
+        if not self.inside_function_body:
+            raise NathSyntaxError(self.peek(), "Yield statement outside of function body")
+        return ast.YieldStatement(self.expression())
+
+    # statements that start with a keyword, the keyword is consumed before calling them
+    KEYWORD_STATEMENTS = {
+        tt.PRINT: print_statement,
+        tt.LEFT_BRACE: block,
+        tt.EACH: each_statement,
+        tt.WHILE: while_statement,
+        tt.IF: if_statement,
+        tt.RETURN: return_statement,
+        tt.BREAK: break_statement,
+        tt.YIELD: yield_statement,
+    }
+
+    ### Expressions, from lowest to highest precedence
     def expression(self):
         return self.function_definition()
-    
-    def function_definition(self): # TODO: separate into param_list(), tt.ARROW, fn_body()
+
+    def function_definition(self):
+        '''Functions are x -> ..., x, y -> ..., (x, y) -> ... or () -> ..., which is decided by
+           looking ahead for the '->' after the parameters, otherwise it's a range expression'''
+        i = self.current
+        left_paren = self.type_at(i) == tt.LEFT_PAREN
+        if left_paren: i += 1
         param_list = []
-        left_paren = self.match([tt.LEFT_PAREN])
-        if var := self.match([tt.IDENTIFIER]):
-            param_list.append(var)
-            while self.match([tt.COMMA]):
-                if var := self.match([tt.IDENTIFIER]): param_list.append(var)
-                else: raise NathSyntaxError(self.peek(), "Trailing comma in parameter list")
-
-            if left_paren: 
-                right_paren = self.match([tt.RIGHT_PAREN])
-                
-            if self.match([tt.ARROW]):
+        if self.type_at(i) == tt.IDENTIFIER:
+            param_list.append(self.tokens[i])
+            i += 1
+            while self.type_at(i) == tt.COMMA:
+                i += 1
+                if self.type_at(i) != tt.IDENTIFIER:
+                    raise NathSyntaxError(self.tokens[i] if i < self.n_tokens else Token(tt.EOF),
+                                          "Trailing comma in parameter list")
+                param_list.append(self.tokens[i])
+                i += 1
+            right_paren = left_paren and self.type_at(i) == tt.RIGHT_PAREN
+            if right_paren: i += 1
+
+            if self.type_at(i) == tt.ARROW:
+                self.current = i + 1
                 expr = self.finish_function_definition(param_list)
-                if left_paren and right_paren is None: 
+                if left_paren and not right_paren: # (x -> x + 1)
                     expr = ast.Grouping(expr)
-                    self.match([tt.RIGHT_PAREN])
+                    self.match(tt.RIGHT_PAREN)
                 return expr
-            elif len(param_list) == 1:
-                if left_paren: 
-                    if right_paren: self.current -= 3
-                    else: self.current -= 2
-                else: self.current -= 1
-                return self.range_expression()
-            else:
-                raise NathSyntaxError(var, "Expected '->' after argument list")
-
-        elif left_paren:
-            if self.match([tt.RIGHT_PAREN]) and self.match([tt.ARROW]):
-                return self.finish_function_definition(param_list)
-            else: self.current -= 1
+            elif len(param_list) > 1:
+                raise NathSyntaxError(param_list[-1], "Expected '->' after argument list")
+
+        elif left_paren and self.type_at(i) == tt.RIGHT_PAREN and self.type_at(i + 1) == tt.ARROW:
+            self.current = i + 2
+            return self.finish_function_definition(param_list)
 
         return self.range_expression()
 
     def finish_function_definition(self, param_list):
         self.inside_function_body += 1
-        if self.match([tt.LEFT_BRACE]): body = self.block()
+        if self.type_at(self.current) == tt.LEFT_BRACE and not self.starts_record(self.current):
+            self.current += 1
+            body = self.block()
         else: body = ast.Block([ast.ReturnStatement(self.expression())]) # implicit return stmt
         self.inside_function_body += 1
         return ast.FunctionDefinition(param_list, body)
 
     def range_expression(self):
         low = self.logical_not()
-        if self.match([tt.DOT_DOT]):
+        if dots := self.match(tt.DOT_DOT):
             high = self.logical_not()
-            step = ast.Literal(1.0)
-            if self.match([tt.DOT_DOT]):
+            step = ast.Literal(1)
+            if self.match(tt.DOT_DOT):
                 step = self.logical_not()
-            return ast.Range(low, high, step)
+            return ast.Range(low, high, step, dots)
         return low
-    
+
     def logical_not(self): # same code as unary_left, but 'not' has lower precedence
-        if operator := self.match([tt.NOT]):
+        if operator := self.match(tt.NOT):
             expr = self.logical_not()
             return ast.Unary(operator, expr)
-        else: 
-            return self.logical_binary()
-
-    def binary_constructor(self, operators, next_fn):
-        def f():
-            expr: ast.AstNode = next_fn()
-            while operator := self.match(operators):
-                right: ast.AstNode = next_fn()
-                expr = ast.Binary(expr, operator, right)
-            return expr 
-        return f
-    
-    def logical_binary(self):
-        return self.binary_constructor([tt.AND, tt.OR], 
-            self.equality)()
-
-    def equality(self):
-        return self.binary_constructor([tt.EQUAL_EQUAL, tt.BANG_EQUAL], 
-            self.comparison)()
-    
-    def comparison(self):
-        return self.binary_constructor([tt.GT, tt.GT_EQUAL, tt.LT, tt.LT_EQUAL], 
-            self.term)()
-    
-    def term(self):
-        return self.binary_constructor([tt.PLUS, tt.MINUS], 
-            self.factor)()
-    
-    def factor(self):
-        return self.binary_constructor([tt.STAR, tt.SLASH], 
-            self.unary_left)()
+        else:
+            return self.binary(1)
+
+    def binary(self, min_precedence):
+        '''Precedence climbing over BINARY_PRECEDENCE, parses operators that bind at least as
+           tight as ``min_precedence``'''
+        expr = self.unary_left()
+        while True:
+            precedence = BINARY_PRECEDENCE.get(self.type_at(self.current))
+            if precedence is None or precedence < min_precedence: return expr
+            operator = self.tokens[self.current]
+            self.current += 1
+            right = self.binary(precedence + 1) if precedence < MAX_PRECEDENCE else self.unary_left()
+            expr = ast.Binary(expr, operator, right)
 
     def unary_left(self):
-        if operator := self.match([tt.MINUS, tt.PLUS]):
+        if self.type_at(self.current) in PREFIX_OPERATORS:
+            operator = self.advance()
             expr = self.unary_left()
             return ast.Unary(operator, expr)
+        if keyword := self.match(tt.SPAWN):
+            call = self.function_call()
+            if type(call) is not ast.FunctionCall:
+                raise NathSyntaxError(keyword, "Expected a function call after 'spawn'")
+            return ast.Spawn(call.callee, call.arguments, keyword)
+        if keyword := self.match(tt.AWAIT):
+            return ast.Await(self.unary_left(), keyword)
         return self.implicit_multiplication()
 
     def implicit_multiplication(self):
         lhs = self.power()
-        next_tok = self.peek()
-        if self.is_number(lhs) and next_tok.type in [tt.IDENTIFIER, tt.LEFT_PAREN]:
+        next_type = self.type_at(self.current)
+        if (next_type == tt.IDENTIFIER or next_type == tt.LEFT_PAREN) and self.is_number(lhs):
+            next_tok = self.tokens[self.current]
             rhs = self.implicit_multiplication()
             mul_op = Token(tt.STAR, '*', None, next_tok.line_num)
             return ast.Binary(lhs, mul_op, rhs)
         return lhs
-    
+
     def power(self):
-        return self.binary_constructor([tt.CARET], 
-            self.unary_right)()
-        
-    def unary_right(self, expr=None):
-        if expr is None: 
-            expr = self.function_call()
-        if operator := self.match([tt.BANG]):
-            expr = self.unary_right(expr)
-            return ast.Unary(operator, expr)
+        expr = self.unary_right()
+        while operator := self.match(tt.CARET):
+            expr = ast.Binary(expr, operator, self.unary_right())
         return expr
-    
-    def function_call(self):
-        expr = self.primary()
-        while self.match([tt.LEFT_PAREN]):
-            expr = self.finish_call(expr)
+
+    def unary_right(self):
+        expr = self.function_call()
+        if self.type_at(self.current) == tt.BANG:
+            bangs = []
+            while bang := self.match(tt.BANG): bangs.append(bang)
+            for bang in reversed(bangs): expr = ast.Unary(bang, expr) # x!! is Unary(!, Unary(!, x))
         return expr
+
+    def function_call(self): # also handles indexing and fields, ie f(x)[0](y).z
+        expr = self.primary()
+        while True:
+            next_type = self.type_at(self.current)
+            if next_type == tt.LEFT_PAREN:
+                self.current += 1
+                expr = self.finish_call(expr)
+            elif next_type == tt.LEFT_BRACKET:
+                self.current += 1
+                expr = self.finish_index(expr, self.previous())
+            elif next_type == tt.DOT:
+                self.current += 1
+                expr = ast.FieldAccess(expr, self.has_to_match(tt.IDENTIFIER, "Expected field name after '.'"))
+            else: return expr
     def finish_call(self, calle):
         arguments = []
-        if not self.match([tt.RIGHT_PAREN], consume=False):
+        if self.type_at(self.current) != tt.RIGHT_PAREN:
             arguments.append(self.range_expression())
-            while self.match([tt.COMMA]):
+            while self.match(tt.COMMA):
                 arguments.append(self.range_expression())
-        self.has_to_match([tt.RIGHT_PAREN], "Parenthesis mismatch")
-        return ast.FunctionCall(calle, arguments)
-    
+        paren = self.has_to_match(tt.RIGHT_PAREN, "Parenthesis mismatch")
+        return ast.FunctionCall(calle, arguments, paren)
+    def finish_index(self, target, bracket):
+        index = self.range_expression()
+        self.has_to_match(tt.RIGHT_BRACKET, "Bracket mismatch")
+        return ast.Index(target, bracket, index)
+
+    def list_literal(self):
+        elements = []
+        self.consume_newlines()
+        if self.type_at(self.current) != tt.RIGHT_BRACKET:
+            elements.append(self.range_expression())
+            while self.match(tt.COMMA):
+                self.consume_newlines()
+                elements.append(self.range_expression())
+        self.consume_newlines()
+        self.has_to_match(tt.RIGHT_BRACKET, "Bracket mismatch")
+        return ast.ListLiteral(elements)
+
+    def starts_record(self, i):
+        '''If the '{' at i is a record like {x: 1} and not a block, ie the body of a function'''
+        while self.type_at(i + 1) == tt.NEWLINE: i += 1
+        return self.type_at(i + 1) == tt.IDENTIFIER and self.type_at(i + 2) == tt.COLON
+
+    def record_literal(self):
+        names, values = [], []
+        self.consume_newlines()
+        if self.type_at(self.current) != tt.RIGHT_BRACE:
+            while True:
+                name = self.has_to_match(tt.IDENTIFIER, "Expected field name in record")
+                if any(n.lexeme == name.lexeme for n in names):
+                    raise NathSyntaxError(name, f"Duplicate field '{name.lexeme}' in record")
+                self.has_to_match(tt.COLON, "Expected ':' after field name")
+                names.append(name)
+                values.append(self.range_expression())
+                if not self.match(tt.COMMA): break
+                self.consume_newlines()
+        self.consume_newlines()
+        self.has_to_match(tt.RIGHT_BRACE, "Brace mismatch")
+        return ast.RecordLiteral(names, values)
+
     def primary(self):
-        if self.match([tt.TRUE]): return ast.Literal(True)
-        if self.match([tt.FALSE]): return ast.Literal(False)
-        if self.match([tt.NULL]): return ast.Literal(None)
-        if name := self.match([tt.IDENTIFIER]): 
-            return ast.Variable(name)
-        if token := self.match([tt.STRING, tt.NUMBER]):
+        if self.current >= self.n_tokens: raise NathSyntaxError(self.peek(), "Expected expression")
+        token = self.tokens[self.current]
+        if token.type == tt.IDENTIFIER:
+            self.current += 1
+            return ast.Variable(token)
+        if token.type == tt.NUMBER or token.type == tt.STRING:
+            self.current += 1
             return ast.Literal(token.literal)
-        if self.match([tt.LEFT_PAREN]):
+        if token.type in LITERALS:
+            self.current += 1
+            return ast.Literal(LITERALS[token.type])
+        if token.type == tt.LEFT_PAREN:
+            self.current += 1
             expr = self.expression()
-            self.has_to_match([tt.RIGHT_PAREN], "Parenthesis mismatch")
+            self.has_to_match(tt.RIGHT_PAREN, "Parenthesis mismatch")
             return ast.Grouping(expr)
-        raise NathSyntaxError(self.peek(), "Expected expression")
\ No newline at end of file
+        if token.type == tt.LEFT_BRACKET:
+            self.current += 1
+            return self.list_literal()
+        if token.type == tt.LEFT_BRACE: # a statement that starts with '{' is a block
+            self.current += 1
+            return self.record_literal()
+        raise NathSyntaxError(token, "Expected expression")
@@ -0,0 +1,83 @@
+import io, warnings
+from dataclasses import dataclass
+
+from src import parallel_parser, interpreter, snapshot, tasks
+from src.objects import NathArray
+from src.errors import NathRuntimeError
+from src.resolver import FreeVariables
+from src.inliner import Inliner
+from src.type_inference import TypeInference
+
+@dataclass
+class RunResult():
+    bindings: dict  # global variables after the run, without the builtins
+    output: str     # what the script printed, None unless capture_output=True
+
+class Program():
+    '''A scanned and parsed script that can be run many times, ie
+
+           program = nath.compile("y = 2x^2 + 1")
+           program.run(bindings={'x': 3}).bindings['y']  # 19
+
+       All state of a run lives in its own Interpreter and the syntax tree isnt modified by
+       running it, apart from the locked jit cache and the inline caches of field accesses. Those
+       can race, but a stale cache only misses (see ast.FieldAccess), so one Program can be run
+       by many threads at once. Raises NathSyntaxError for invalid source.'''
+
+    def __init__(self, source: str, parse_processes: int=1):
+        self.source = source
+        # a Parser keeps its position while parsing, so each Program uses its own. huge sources 
+        # can be parsed in pieces on a pool of ``parse_processes`` (None for one per core)
+        self.statements = parallel_parser.parse(source, parse_processes)
+        Inliner().inline(self.statements)
+        self.checks_removed = TypeInference().infer(self.statements) # operand type checks
+        FreeVariables().resolve(self.statements)
+
+    def run(self, bindings: dict=None, capture_output=False, setup: 'Program'=None, snapshot_path: str=None,
+            **interpreter_options) -> RunResult:
+        '''Run the program in a fresh global scope with ``bindings`` predefined. Interpreter options 
+           (jit_threshold, budget, ...) are passed on to Interpreter(). Raises NathRuntimeError.
+
+           The ``setup`` program runs first, without the bindings. With a ``snapshot_path`` the
+           globals it defines are restored from there instead, if it's a snapshot of the same
+           setup, otherwise they're saved there after it ran (see src/snapshot.py). If they can't
+           be saved (ie an iterator) the run goes on and only warns.'''
+        output = io.StringIO() if capture_output else None
+        interp = interpreter.Interpreter(output=output, **interpreter_options)
+        self.execute(interp, bindings, setup, snapshot_path)
+        return self.result(interp, output)
+
+    async def run_async(self, bindings: dict=None, capture_output=False, setup: 'Program'=None,
+                        snapshot_path: str=None, **interpreter_options) -> RunResult:
+        '''run() as a task on the running asyncio event loop. While it waits in sleep(), read_file()
+           or await, other tasks (ie other runs) go on, and it can spawn tasks of its own. Done when
+           the program and all the tasks it spawned are, see src/tasks.py.'''
+        output = io.StringIO() if capture_output else None
+        interp = interpreter.Interpreter(output=output, **interpreter_options)
+        await tasks.Runtime(interp).run(lambda: self.execute(interp, bindings, setup, snapshot_path))
+        return self.result(interp, output)
+
+    def execute(self, interp: interpreter.Interpreter, bindings, setup, snapshot_path):
+        if setup is not None:
+            if snapshot_path is None or not snapshot.restore(interp, snapshot_path, setup.source):
+                interp.interpret(setup.statements)
+                if snapshot_path is not None: self.save_snapshot(interp, snapshot_path, setup.source)
+        for name, value in (bindings or {}).items():
+            if isinstance(value, (list, tuple, range)): value = NathArray(value)
+            interp.global_scope.define(name, value)
+
+        interp.interpret(self.statements)
+
+    def save_snapshot(self, interp: interpreter.Interpreter, path: str, source: str):
+        # the setup ran fine, so a global that can't be saved only costs the next runs the setup
+        try: snapshot.save(interp, path, source)
+        except (NathRuntimeError, OSError) as e:
+            warnings.warn(f"setup not snapshotted to {path}: {e}", RuntimeWarning, stacklevel=4)
+
+    def result(self, interp: interpreter.Interpreter, output) -> RunResult:
+        result = {name: value for name, value in interp.global_scope.dict.items() 
+                  if interpreter.BUILTINS.get(name) is not value}
+        return RunResult(result, output.getvalue() if output is not None else None)
+
+def compile(source: str, parse_processes: int=1) -> Program:
+    return Program(source, parse_processes)
@@ -0,0 +1,71 @@
+from src.visitor import Visitor
+from src.inliner import children
+from src.shapes import shape_of
+import src.ast_nodes as ast
+
+class FreeVariables(Visitor):
+    '''Collects the names a function body refers to that aren't its own parameters,
+       ie the variables a closure has to capture. Includes the free names of nested functions.'''
+
+    def resolve(self, statements: list):
+        '''Compute the free names (and yielding statements) of every function and the shapes of
+           the record literals in a parsed program up front, so running it doesnt write to the
+           syntax tree'''
+        for stmt, _ in statements: self.visit(stmt)
+
+    def free_names(self, fn: ast.FunctionDefinition) -> tuple:
+        # cached on the node, the result only depends on the (immutable) syntax tree
+        names = getattr(fn, 'free_names', None)
+        if names is None:
+            names = set(self.visit(fn.body))
+            names.difference_update(p.lexeme for p in fn.parameters)
+            names = fn.free_names = tuple(sorted(names))
+        return names
+
+    def default(self, node):
+        return self.recurse(list(node.__dict__.values()))
+
+    def visit_Variable(self, var: ast.Variable):
+        return {var.name.lexeme}
+    def visit_AssignmentStatement(self, stmt: ast.AssignmentStatement):
+        return {stmt.name.lexeme} | self.visit(stmt.value)
+    visit_NumberAssignment = visit_AssignmentStatement
+    def visit_EachStatement(self, stmt: ast.EachStatement):
+        names = self.recurse([stmt.iterable, stmt.body])
+        if stmt.var_name: names.add(stmt.var_name.lexeme)
+        return names
+    def visit_FunctionDefinition(self, fn: ast.FunctionDefinition):
+        yielding_nodes(fn)
+        if fn.number_body is not None: self.visit(fn.number_body) # for the functions defined in it
+        return set(self.free_names(fn))
+    def visit_RecordLiteral(self, expr: ast.RecordLiteral):
+        if expr.shape is None: expr.shape = shape_of(name.lexeme for name in expr.names)
+        return self.recurse(expr.values)
+    def visit_InlinedCall(self, expr: ast.InlinedCall):
+        self.visit(expr.expression) # for the record literals in it, its names are Arguments and globals
+        return self.visit(expr.call)
+
+    def recurse(self, nodes: list):
+        names = set()
+        for node in nodes:
+            if isinstance(node, list): names |= self.recurse(node)
+            elif isinstance(node, ast.AstNode): names |= self.visit(node)
+        return names
+
+
+def yielding_nodes(fn: ast.FunctionDefinition) -> frozenset:
+    '''ids of the statements in the body of ``fn`` that contain a yield (not counting nested
+       functions), empty unless it's a generator function. Cached on the node like free_names'''
+    nodes = getattr(fn, 'yielding_nodes', None)
+    if nodes is None:
+        found = set()
+        def visit(node):
+            if isinstance(node, ast.FunctionDefinition): return False
+            contains = isinstance(node, ast.YieldStatement)
+            for child in children(node):
+                if visit(child): contains = True
+            if contains: found.add(id(node))
+            return contains
+        visit(fn.body)
+        nodes = fn.yielding_nodes = frozenset(found)
+    return nodes
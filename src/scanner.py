@@ -1,18 +1,19 @@
 from src.errors import NathSyntaxError
 from src.tokens import Token, TokenType as tt, lexeme_to_token
 
-one_char_lexemes = ["(", ")", "[", "]", "{", "}", ";", ","]
+one_char_lexemes = ["(", ")", "[", "]", "{", "}", ";", ",", ":"]
 one_or_two_char_lexemes = ["+", "-", "-", "*", "/", "=", "!", "<", ">", "^", "."]
 keywords = ["and", "or", "if", "else", "elseif", "true", "false", "for", "null", 
-    "print", "return", "in", "not", "each", "while", "of", "break"]
+    "print", "return", "in", "not", "each", "while", "of", "break", "yield",
+    "spawn", "await"]
 
 class Scanner():
-    def __init__(self, source):
+    def __init__(self, source, line=1):
         self.source = source
         self.tokens = []
         self.start = 0
         self.current = 0
-        self.line = 1   
+        self.line = line # of the start of source, for scanning pieces of a bigger source
 
     def scan_tokens(self) -> list:
         while not self.is_at_end():
@@ -71,10 +72,14 @@ class Scanner():
     def handle_number(self):
         while self.valid_digit(self.peek()): 
             self.advance()
+        is_float = False
         if self.peek() in ['.', 'e'] and self.peek2().isdigit():
+            is_float = True
             self.advance() # consume decimal point or 'e'
             while self.valid_digit(self.peek()): self.advance()
-        self.add_token(tt.NUMBER, literal=float(self.source[self.start:self.current]))
+        # integer literals stay exact python ints, anything with '.' or 'e' is a float
+        text = self.source[self.start:self.current]
+        self.add_token(tt.NUMBER, literal=float(text) if is_float else int(text))
 
     def handle_identifier(self):
         while self.peek().isalnum() or self.peek() == "_":
@@ -0,0 +1,28 @@
+'''Shapes of records, in a module of their own so the resolver can give record literals
+   their shape before a program runs'''
+
+class Shape():
+    '''Hidden class of records, the names of their fields and where each one is stored. Records
+       that got the same fields in the same order share a shape: shapes form a tree of
+       transitions that add one field, starting at EMPTY_SHAPE.'''
+    __slots__ = ('names', 'offsets', 'transitions')
+
+    def __init__(self, names: tuple=()):
+        self.names = names
+        self.offsets = {name: i for i, name in enumerate(names)}
+        self.transitions = {}
+
+    def with_field(self, name: str) -> 'Shape':
+        shape = self.transitions.get(name)
+        if shape is None: shape = self.transitions.setdefault(name, Shape(self.names + (name,)))
+        return shape
+
+    def __repr__(self):
+        return f"Shape({', '.join(self.names)})"
+
+EMPTY_SHAPE = Shape()
+
+def shape_of(names) -> Shape:
+    shape = EMPTY_SHAPE
+    for name in names: shape = shape.with_field(name)
+    return shape
@@ -0,0 +1,124 @@
+'''Snapshots of the global scope of an Interpreter, so the setup part of a script (lookup tables,
+   helper functions) can be restored by later runs instead of running it again, ie
+
+       if not snapshot.restore(interp, path, setup_source):
+           interp.interpret(setup_statements)
+           snapshot.save(interp, path, setup_source)
+
+   Functions are saved with their syntax tree and closure cells, builtins and the interpreter by
+   reference. A snapshot is only restored by the same interpreter code (a hash of the src/
+   modules) and for the same setup source, otherwise restore returns False. Snapshots are
+   pickles, so only restore files that you made yourself.'''
+import os, sys, pickle, copyreg, hashlib, tempfile
+from functools import cache
+
+from src import interpreter
+import src.ast_nodes as ast
+from src.environment import Cell, MISSING
+from src.errors import NathRuntimeError
+from src.objects import NathFunction, Shape, shape_of
+
+SNAPSHOT_FORMAT = 1
+
+@cache
+def interpreter_version() -> str:
+    '''Hash of the interpreter's source, changes whenever any module in src/ does'''
+    digest = hashlib.sha256(f"{sys.version_info[:2]}".encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            with open(os.path.join(directory, name), 'rb') as f: digest.update(f.read())
+    return digest.hexdigest()
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+def header(source: str) -> dict:
+    return {'format': SNAPSHOT_FORMAT, 'interpreter': interpreter_version(), 'source': source_hash(source)}
+
+def save(interp: interpreter.Interpreter, path: str, source: str):
+    '''Write the globals of ``interp`` (which ran ``source``) to ``path``. Raises NathRuntimeError
+       if a global can't be saved, ie an iterator over a file.'''
+    values = {name: value for name, value in interp.global_scope.dict.items()
+              if interpreter.BUILTINS.get(name) is not value}
+    # a temp file of its own, so a failed save doesnt leave half a snapshot and threads that
+    # save at the same time dont write to the same file
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickler = SnapshotPickler(f, interp)
+            pickler.dump(header(source))
+            pickler.dump(len(values))
+            for name, value in values.items(): # one pickler, so values shared between globals stay shared
+                try: pickler.dump((name, value))
+                except (pickle.PicklingError, TypeError, AttributeError) as e:
+                    raise NathRuntimeError(-69, f"Can't snapshot global '{name}': {e}") from None
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp): os.remove(temp)
+
+def restore(interp: interpreter.Interpreter, path: str, source: str) -> bool:
+    '''Define the globals saved in ``path`` in ``interp``. Returns False (and defines nothing) if
+       there is no snapshot, or it's from another version of the interpreter or another source.'''
+    try: f = open(path, 'rb')
+    except FileNotFoundError: return False
+    with f:
+        unpickler = SnapshotUnpickler(f, interp)
+        try:
+            if unpickler.load() != header(source): return False
+            values = dict(unpickler.load() for _ in range(unpickler.load()))
+        # ie cut off, or from code that pickled other classes
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError,
+                IndexError, KeyError): return False
+    interp.global_scope.dict.update(values)
+    return True
+
+
+### the interpreter and its global scope are saved by reference and replaced by the ones of the
+### interpreter that restores, builtins by name
+class SnapshotPickler(pickle.Pickler):
+    def __init__(self, file, interp: interpreter.Interpreter):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.interp = interp
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table.update({NathFunction: reduce_function, Cell: reduce_cell, Shape: reduce_shape,
+                                    ast.FunctionDefinition: reduce_definition})
+
+    def persistent_id(self, obj):
+        if obj is self.interp: return 'interpreter'
+        if obj is self.interp.global_scope: return 'globals'
+        return None
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, interp: interpreter.Interpreter):
+        super().__init__(file)
+        self.interp = interp
+
+    def persistent_load(self, pid):
+        if pid == 'interpreter': return self.interp
+        if pid == 'globals': return self.interp.global_scope
+        raise pickle.UnpicklingError(f"unknown reference {pid!r}")
+
+# objects are created empty and filled in afterwards, like pickle does by default, so cycles
+# (ie a recursive function that captured itself) work
+def reduce_function(fn: NathFunction):
+    if fn.definition is None: return builtin, (fn.name,)
+    # call counts start over and jit compiled versions arent saved, they're compiled again
+    state = {name: value for name, value in fn.__dict__.items() if name != 'call'}
+    state['call_count'] = 0
+    return copyreg.__newobj__, (NathFunction,), state
+
+def builtin(name: str) -> NathFunction:
+    return interpreter.BUILTINS[name]
+
+def reduce_cell(cell: Cell):
+    if cell.value is MISSING: return Cell, ()
+    return copyreg.__newobj__, (Cell,), (None, {'value': cell.value})
+
+def reduce_shape(shape: Shape):
+    # restored records get the shared shape with the same fields, not a copy
+    return shape_of, (shape.names,)
+
+def reduce_definition(fn: ast.FunctionDefinition):
+    # without the caches on the node, the jit cache holds code objects
+    return copyreg.__newobj__, (ast.FunctionDefinition,), {'parameters': fn.parameters, 'body': fn.body}
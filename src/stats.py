@@ -0,0 +1,108 @@
+import sys
+
+from src.objects import NathFunction
+
+PHASES = ('scan_time', 'parse_time', 'execute_time') # seconds
+COMPILED = ('checks_removed',) # operand type checks the type inference proved unneeded
+COUNTERS = ('nodes_evaluated', 'function_calls', 'environments_created', 'control_flow_exceptions',
+            'printed_chars', 'printed_lines')
+MAXIMUMS = ('peak_call_depth', 'largest_range')
+
+class Stats():
+    '''What one run did, or the totals of many runs. Nodes are only counted while interpreting,
+       jit compiled functions run without evaluating nodes, creating environments or raising
+       Return/Break.'''
+    def __init__(self):
+        for name in PHASES + COMPILED + COUNTERS + MAXIMUMS: setattr(self, name, 0)
+
+    def add(self, other: 'Stats'):
+        for name in PHASES + COMPILED + COUNTERS: setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in MAXIMUMS: setattr(self, name, max(getattr(self, name), getattr(other, name)))
+
+    def as_dict(self, counters=True) -> dict:
+        names = PHASES + COMPILED + (COUNTERS + MAXIMUMS if counters else ())
+        return {name: getattr(self, name) for name in names}
+
+
+class StatsRecorder():
+    '''Counts what an Interpreter does into ``self.stats`` by wrapping its methods on the instance,
+       so an interpreter that isn't recorded runs exactly the same code as without stats.
+       Has to be created before the interpreter runs anything, since compiled functions keep
+       the jit helpers they were made with.'''
+    def __init__(self, interp):
+        self.stats = Stats()
+        self.depth = 0
+        recorder = self
+
+        visit = interp.visit
+        def evaluate(node, *args, **kwargs):
+            recorder.stats.nodes_evaluated += 1
+            return visit(node, *args, **kwargs)
+
+        def counted_call(call):
+            def f(*args, **kwargs):
+                stats = recorder.stats
+                stats.function_calls += 1
+                recorder.depth += 1
+                if recorder.depth > stats.peak_call_depth: stats.peak_call_depth = recorder.depth
+                try: return call(*args, **kwargs)
+                finally: recorder.depth -= 1
+            return f
+        do_call = counted_call(interp.do_call)
+        def counting_do_call(callee, arguments, paren=None):
+            # interpreted functions get an environment for their parameters, compiled ones replace .call
+            if type(callee) is NathFunction and callee.definition is not None and 'call' not in callee.__dict__:
+                recorder.stats.environments_created += 1
+            return do_call(callee, arguments, paren)
+
+        def counted(method, counter):
+            def f(*args, **kwargs):
+                stats = recorder.stats
+                setattr(stats, counter, getattr(stats, counter) + 1)
+                return method(*args, **kwargs)
+            return f
+
+        make_range = interp.make_range
+        def measured_make_range(indices, dots):
+            result = make_range(indices, dots)
+            if len(result) > recorder.stats.largest_range: recorder.stats.largest_range = len(result)
+            return result
+
+        interp.evaluate = evaluate
+        interp.do_call = counting_do_call
+        interp.visit_InlinedCall = counted_call(interp.visit_InlinedCall)
+        interp.visit_FunctionDefinition = counted(interp.visit_FunctionDefinition, 'environments_created') # closure
+        interp.visit_EachStatement = counted(interp.visit_EachStatement, 'environments_created') # loop scope
+        interp.visit_ReturnStatement = counted(interp.visit_ReturnStatement, 'control_flow_exceptions')
+        interp.visit_BreakStatement = counted(interp.visit_BreakStatement, 'control_flow_exceptions')
+        interp.make_range = measured_make_range
+        interp.output = CountingOutput(interp.output, self)
+        if interp.jit is not None: # compiled code still calls functions directly, counted like do_call
+            budget = interp.budget
+            def counting_call(paren, callee, *args):
+                if type(callee) is not NathFunction or len(args) != callee.arity or budget is not None:
+                    return interp.do_call(callee, list(args), paren)
+                stats = recorder.stats
+                stats.function_calls += 1
+                if callee.definition is not None and 'call' not in callee.__dict__: stats.environments_created += 1
+                recorder.depth += 1
+                if recorder.depth > stats.peak_call_depth: stats.peak_call_depth = recorder.depth
+                try: return callee.call(*args)
+                finally: recorder.depth -= 1
+            interp.jit.helpers['_call'] = counting_call
+
+
+class CountingOutput():
+    '''Counts what print statements write to ``target`` (stdout if None)'''
+    def __init__(self, target, recorder: StatsRecorder):
+        self.target = target
+        self.recorder = recorder
+
+    def write(self, text):
+        stats = self.recorder.stats
+        stats.printed_chars += len(text)
+        stats.printed_lines += text.count('\n')
+        return (self.target or sys.stdout).write(text)
+
+    def flush(self):
+        (self.target or sys.stdout).flush()
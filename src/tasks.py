@@ -0,0 +1,194 @@
+'''Async runtime: scripts run as tasks on an asyncio event loop, so while one waits (sleep(),
+   read_file(), await) the other scripts and the tasks they spawned run, ie
+
+       t = spawn fetch(1)    # fetch(1) runs as a task of its own, t is its handle
+       print await t         # waits until it's done and gives its result
+
+   The interpreter is a recursive tree walker, so a task can't return to the event loop from the
+   middle of a call like a python coroutine does. Each task runs the existing call path in a
+   thread of its own instead, but only ever one of them: the event loop gives a task the turn and
+   blocks until it pauses at something to wait for, which the loop then awaits while the other
+   tasks take turns. So the tasks of an interpreter never run at the same time, and when a task
+   pauses and resumes it swaps the interpreter state (the current scope, ...) like a generator.
+
+   A waiting task keeps its thread, so there are at most MAX_THREADS of them per event loop,
+   shared by all the runtimes on it (ie many scripts started with run_async). Other tasks wait
+   for one of them to finish before they start, and a task that's awaited before it got a thread
+   runs in the thread of the task that awaits it, like a call. So tasks that await tasks can't all
+   end up waiting for a thread.'''
+import asyncio, threading, weakref
+from collections import deque
+
+from src.errors import NathRuntimeError
+
+MAX_THREADS = 256 # per event loop
+
+current = threading.local() # the task that runs on this thread
+
+def current_task() -> 'Task':
+    '''The task that is running, None outside of the async runtime'''
+    return getattr(current, 'task', None)
+
+class Runtime():
+    '''The tasks of one interpreter'''
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.tasks = []    # known to the event loop, in order
+        self.pending = []  # spawned since the event loop last had the turn
+        self.finished = [] # ran in the thread of a task that awaited them since then
+        self.threads = None
+
+    async def run(self, target):
+        '''Run ``target()`` as the main task. Returns its result once it and every task spawned
+           meanwhile are done, raises the first error of any of them.'''
+        self.threads = threads_of(asyncio.get_running_loop())
+        main = self.spawn(target, where=-69)
+        self.start_pending()
+        try:
+            result = await main.future
+            i = 0
+            while i < len(self.tasks): # tasks can spawn more while we wait
+                await self.tasks[i].future
+                i += 1
+            return result
+        finally: # ie cancelled, or a task failed
+            for task in self.tasks: task.cancel()
+
+    def spawn(self, target, where) -> 'Task':
+        task = Task(self, target, where)
+        self.pending.append(task)
+        return task
+
+    def start_pending(self):
+        '''Called by the event loop whenever it gets the turn back from a task'''
+        loop = asyncio.get_running_loop()
+        for task in self.pending:
+            task.future = loop.create_future()
+            self.tasks.append(task)
+            if not task.started: self.threads.start(task)
+        self.pending.clear()
+        for task in self.finished: task.finish()
+        self.finished.clear()
+
+
+class Threads():
+    '''Starts tasks in threads of their own, at most MAX_THREADS at once'''
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.queue = deque() # tasks that wait for a thread
+
+    def start(self, task: 'Task'):
+        if self.running < MAX_THREADS: self.run(task)
+        else: self.queue.append(task)
+
+    def run(self, task: 'Task'):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        task.started = True
+        task.driver = asyncio.ensure_future(task.run())
+
+    def release(self):
+        self.running -= 1
+        while self.queue and self.running < MAX_THREADS:
+            task = self.queue.popleft()
+            if not task.started and not task.future.done(): self.run(task) # not run by an await, or cancelled
+
+threads = weakref.WeakKeyDictionary() # of each event loop
+
+def threads_of(loop) -> Threads:
+    if loop not in threads: threads[loop] = Threads()
+    return threads[loop]
+
+
+class Task():
+    '''Runs ``target()`` in its own thread, one step (up to the next pause) whenever the event loop
+       gives it the turn. The handle that spawn returns to scripts.'''
+    def __init__(self, runtime: Runtime, target, where):
+        self.runtime = runtime
+        self.target = target
+        self.where = where   # of the spawn, for errors
+        self.future = None   # its result, once the event loop knows about it
+        self.driver = None   # the asyncio task that runs it in a thread, if it got one
+        self.started = False # in a thread of its own, or by a task that awaited it
+        self.done = False
+        self.turn = threading.Semaphore(0)   # the event loop gives the task the turn
+        self.paused = threading.Semaphore(0) # and gets it back
+        self.waiting_for = None # awaitable the task paused at, None when it's done
+        self.sent = (None, None) # what waiting for it gave, (value, error)
+        self.result = self.error = None
+
+    async def run(self):
+        thread = threading.Thread(target=self.main, daemon=True)
+        thread.start()
+        try:
+            while True:
+                self.turn.release()
+                self.paused.acquire() # the task runs while the event loop waits
+                self.runtime.start_pending()
+                if self.waiting_for is None: break
+                try: self.sent = (await self.waiting_for, None)
+                except BaseException as e: self.sent = (None, e) # ie cancelled, raised in the task
+            thread.join()
+        finally: self.runtime.threads.release()
+        self.finish()
+
+    def main(self):
+        self.turn.acquire()
+        current.task = self
+        self.execute()
+        self.waiting_for = None
+        self.paused.release()
+
+    def execute(self):
+        interp = self.runtime.interpreter
+        outer = interp.env, interp.arguments
+        interp.env, interp.arguments = interp.global_scope, None # not in the scope of whoever spawned it
+        try: self.result = self.target()
+        except RecursionError: self.error = NathRuntimeError(self.where, "Maximum recursion depth exceeded")
+        except BaseException as e: self.error = e
+        finally: interp.env, interp.arguments = outer
+        self.done = True
+
+    def finish(self):
+        '''Hands the result to the event loop'''
+        if self.future.done(): return # cancelled
+        if self.error is not None: self.future.set_exception(self.error)
+        else: self.future.set_result(self.result)
+
+    def cancel(self):
+        self.future.cancel()
+        if self.driver is not None: self.driver.cancel()
+
+    def wait(self, awaitable):
+        '''Pause the task until the event loop awaited ``awaitable`` (created on this thread, but
+           awaited by the loop), returns its result or raises its error'''
+        interp = self.runtime.interpreter
+        budget = interp.budget
+        state = interp.env, interp.arguments, getattr(interp, 'stmt_line_num', None), budget and budget.depth
+        self.waiting_for = awaitable
+        self.paused.release()
+        self.turn.acquire() # meanwhile the other tasks use the interpreter
+        interp.env, interp.arguments, interp.stmt_line_num, depth = state
+        if budget is not None: budget.depth = depth
+        value, error = self.sent
+        self.sent = (None, None)
+        if error is not None: raise error
+        return value
+
+    def wait_for(self, task: 'Task'):
+        '''The result of ``task``, which runs now in this thread if it didn't start yet'''
+        if not task.started:
+            task.started = True
+            task.execute()
+            task.runtime.finished.append(task)
+        if not task.done: return self.wait(task.join())
+        if task.error is not None: raise task.error
+        return task.result
+
+    async def join(self):
+        return await self.future
+
+    def __repr__(self):
+        if not self.started: return "task (not started)"
+        return "task (done)" if self.done else "task (running)"
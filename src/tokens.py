@@ -50,9 +50,14 @@ class TokenType():
     NUMBER = "NUMBER"
     SEMICOLON = "SEMICOLON"
     COMMA = "COMMA"
+    COLON = "COLON"
+    DOT = "DOT"
     DOT_DOT = "DOT_DOT"
     RETURN = "RETURN"
     BREAK = "BREAK"
+    YIELD = "YIELD"
+    SPAWN = "SPAWN"
+    AWAIT = "AWAIT"
     CONTINUE = "CONTINUE"
     NEWLINE = "NEWLINE"
     EOF = "EOF"
@@ -102,9 +107,14 @@ lexeme_to_token = {
     "of": tt.OF,
     "return": tt.RETURN,
     "break": tt.BREAK,
+    "yield": tt.YIELD,
+    "spawn": tt.SPAWN,
+    "await": tt.AWAIT,
     "continue": tt.CONTINUE,
     ";": tt.SEMICOLON,
     ",": tt.COMMA,
+    ":": tt.COLON,
+    ".": tt.DOT,
     "..": tt.DOT_DOT,
     "\n": tt.NEWLINE,
     "\0": tt.EOF
@@ -0,0 +1,333 @@
+import dataclasses
+
+import src.ast_nodes as ast
+from src.tokens import TokenType as tt
+from src.visitor import Visitor
+from src.resolver import yielding_nodes
+
+NUMBER, BOOL, STRING, NULL, LIST, RECORD, FUNCTION = 'number', 'bool', 'string', 'null', 'list', 'record', 'function'
+
+ARITHMETIC = frozenset([tt.MINUS, tt.STAR, tt.SLASH]) # always give a number, or raise (^ might not, ie (-8)^0.5)
+COMPARISONS = frozenset([tt.GT, tt.GT_EQUAL, tt.LT, tt.LT_EQUAL])
+AUGMENTED = {tt.PLUS_EQUAL: tt.PLUS, tt.MINUS_EQUAL: tt.MINUS, tt.STAR_EQUAL: tt.STAR,
+             tt.SLASH_EQUAL: tt.SLASH, tt.CARET_EQUAL: tt.CARET}
+
+class TypeInference(Visitor):
+    '''Finds the arithmetic and comparisons whose operands are always numbers and replaces them
+       with NumberUnary/NumberBinary/NumberAssignment nodes, which skip the operand type checks.
+
+       Types flow forward through assignments, ie after ``x = 2y`` x is a number (or the
+       multiplication raised). Calls (and generators resuming in each-loops, and yields) can
+       assign any global, so they forget what's known about variables, apart from the parameters
+       and range loop variables that nothing in their scope assigns to. Loops are analysed until
+       what's known at their start doesn't change. Nothing is assumed about variables the program
+       didn't assign, ie bindings or globals of earlier runs.
+
+       Global functions that are only ever called, with number arguments, get a ``number_body``
+       where the parameters are numbers, NathFunction uses it when the arguments are numbers.
+
+       Modifies the syntax tree, it should run once after the Inliner. Returns the number of
+       checks it removed.'''
+
+    def infer(self, statements: list) -> int:
+        self.candidates = self.candidate_functions(statements)
+        # assume all candidates are only called with numbers, drop the ones that aren't until that holds
+        # (sets of ids, syntax tree nodes compare by value)
+        self.numeric = {id(fn) for fn in self.candidates.values()}
+        while True:
+            self.number_calls = dict.fromkeys(self.numeric, True)
+            self.run(statements, record=False)
+            numeric = {key for key in self.numeric if self.number_calls[key]}
+            if numeric == self.numeric: break
+            self.numeric = numeric
+        for fn in self.candidates.values():
+            if id(fn) in self.numeric: fn.number_body = copy_tree(fn.body)
+        self.proven = {}
+        self.run(statements, record=True)
+        statements[:] = [(rewritten(stmt, self.proven), line) for stmt, line in statements]
+        return len(self.proven)
+
+    def candidate_functions(self, statements) -> dict:
+        '''Global functions that are assigned once and only used as the callee of calls'''
+        assignments, calls, uses = {}, {}, {}
+        def count(node, parent=None):
+            if isinstance(node, ast.AssignmentStatement): key = node.name.lexeme
+            elif isinstance(node, ast.EachStatement) and node.var_name: key = node.var_name.lexeme
+            else: key = None
+            if key: assignments[key] = assignments.get(key, 0) + 1
+            if isinstance(node, ast.FunctionDefinition):
+                for p in node.parameters: assignments[p.lexeme] = assignments.get(p.lexeme, 0) + 2
+            if isinstance(node, (ast.Variable, ast.GlobalVariable)):
+                name = node.name.lexeme
+                uses[name] = uses.get(name, 0) + 1
+                if isinstance(parent, ast.FunctionCall) and parent.callee is node: calls[name] = calls.get(name, 0) + 1
+            for child in nodes(node): count(child, node)
+        for stmt, _ in statements: count(stmt)
+
+        candidates = {}
+        for stmt, _ in statements:
+            if not isinstance(stmt, ast.AssignmentStatement) or stmt.operator.type != tt.EQUAL: continue
+            value = stmt.value
+            while isinstance(value, ast.Grouping): value = value.expression
+            name = stmt.name.lexeme
+            if isinstance(value, ast.FunctionDefinition) and assignments[name] == 1 and value.parameters \
+                    and uses.get(name, 0) == calls.get(name, 0) and not yielding_nodes(value):
+                candidates[name] = value
+        return candidates
+
+    def run(self, statements, record: bool):
+        self.record = record
+        self.known, self.pinned = {}, frozenset()
+        self.breaks, self.arguments = [], None
+        for stmt, _ in statements: self.visit(stmt)
+
+    ### what's known about variables
+    def forget(self):
+        '''After a call, only the variables nothing can assign are still known'''
+        self.known = {name: t for name, t in self.known.items() if name in self.pinned}
+
+    def prove(self, node):
+        if self.record: self.proven[id(node)] = node
+
+    def loop(self, body, exit):
+        '''Analyse ``body`` (a function that visits the loop once) until what's known at the
+           start of the loop is the same as at the end of it, then once more to record proofs.
+           ``exit`` visits what runs when the loop ends without a break'''
+        record = self.record
+        self.record = False
+        while True:
+            start = self.known
+            self.breaks.append([])
+            body()
+            self.breaks.pop()
+            self.known = meet(start, self.known)
+            if self.known == start: break
+        self.record = record
+        self.breaks.append([])
+        body()
+        breaks = self.breaks.pop()
+        self.known = dict(start)
+        self.record = False # visited in the loop already
+        exit()
+        self.record = record
+        for known in breaks: self.known = meet(self.known, known)
+
+    ### Statements
+    def default(self, node):
+        for child in nodes(node): self.visit(child)
+
+    def visit_AssignmentStatement(self, stmt: ast.AssignmentStatement):
+        name = stmt.name.lexeme
+        current = self.known.get(name) # read before the value is evaluated
+        value = self.visit(stmt.value)
+        if stmt.operator.type != tt.EQUAL:
+            value = self.operation(stmt, current, value, AUGMENTED[stmt.operator.type])
+        self.known[name] = value
+
+    def visit_IfStatement(self, stmt: ast.IfStatement):
+        self.visit(stmt.condition)
+        before = self.known
+        self.known = dict(before)
+        self.visit(stmt.main_branch)
+        after_main, self.known = self.known, dict(before)
+        if stmt.else_branch is not None: self.visit(stmt.else_branch)
+        # a branch that ends with a break or return doesnt continue after the if
+        if jumps(stmt.else_branch): self.known = after_main
+        elif not jumps(stmt.main_branch): self.known = meet(after_main, self.known)
+
+    def visit_WhileStatement(self, stmt: ast.WhileStatement):
+        def body():
+            self.known = dict(self.known)
+            self.visit(stmt.condition)
+            self.visit(stmt.body)
+        self.loop(body, exit=lambda: self.visit(stmt.condition))
+
+    def visit_EachStatement(self, stmt: ast.EachStatement):
+        self.visit(stmt.iterable)
+        name = stmt.var_name.lexeme if stmt.var_name else None
+        is_range = isinstance(stmt.iterable, ast.Range)
+        pinned = self.pinned
+        if name is not None and is_range and name not in assigned_names(stmt.body):
+            self.pinned = pinned | {name}
+        def body():
+            self.known = dict(self.known)
+            if not is_range: self.forget() # the next element might come from a generator
+            if name is not None:
+                if is_range: self.known[name] = NUMBER
+                else: self.known.pop(name, None)
+            self.visit(stmt.body)
+        self.loop(body, exit=lambda: is_range or self.forget())
+        self.pinned = pinned
+        if name is not None: self.known.pop(name, None) # the loop variable is gone after the loop
+
+    def visit_BreakStatement(self, stmt: ast.BreakStatement):
+        if self.breaks: self.breaks[-1].append(dict(self.known))
+
+    def visit_YieldStatement(self, stmt: ast.YieldStatement):
+        self.visit(stmt.value)
+        self.forget() # the loop over the generator runs in between
+
+    def visit_Await(self, expr: ast.Await):
+        self.visit(expr.task)
+        self.forget() # the other tasks run meanwhile
+        return None
+
+    ### Expressions, visiting one returns its type (None if it isn't known)
+    def visit_Literal(self, expr: ast.Literal):
+        if expr.value is None: return NULL
+        return {bool: BOOL, int: NUMBER, float: NUMBER, str: STRING}.get(type(expr.value))
+
+    def visit_Grouping(self, expr: ast.Grouping):
+        return self.visit(expr.expression)
+
+    def visit_Variable(self, var: ast.Variable):
+        return self.known.get(var.name.lexeme)
+
+    def visit_GlobalVariable(self, var: ast.GlobalVariable):
+        return None
+
+    def visit_Argument(self, arg: ast.Argument):
+        return self.arguments[arg.index] if self.arguments is not None else None
+
+    def visit_Unary(self, expr: ast.Unary):
+        value = self.visit(expr.expression)
+        match expr.operator.type:
+            case tt.NOT: return BOOL
+            case tt.BANG: return NUMBER # still checks for decimals
+        if value == NUMBER: self.prove(expr)
+        return NUMBER
+
+    def visit_Binary(self, expr: ast.Binary):
+        left = self.visit(expr.left)
+        if expr.operator.type in (tt.AND, tt.OR):
+            known = dict(self.known) # the right side might not run
+            right = self.visit(expr.right)
+            self.known = meet(known, self.known)
+            return left if left == right else None
+        return self.operation(expr, left, self.visit(expr.right), expr.operator.type)
+
+    def operation(self, node, left, right, op_type):
+        if op_type in (tt.EQUAL_EQUAL, tt.BANG_EQUAL): return BOOL
+        if left == NUMBER and right == NUMBER: self.prove(node)
+        if op_type in COMPARISONS: return BOOL
+        if op_type in ARITHMETIC: return NUMBER
+        if op_type == tt.CARET: return None
+        return left if left == right and left in (NUMBER, STRING) else None # +
+
+    def visit_FunctionCall(self, expr: ast.FunctionCall):
+        self.visit(expr.callee)
+        arguments = [self.visit(arg) for arg in expr.arguments]
+        self.forget()
+        fn = self.candidate(expr.callee)
+        if fn is not None and (len(arguments) != len(fn.parameters) or any(t != NUMBER for t in arguments)):
+            self.number_calls[id(fn)] = False
+        return None
+
+    def candidate(self, callee):
+        '''The candidate function that ``callee`` names, if any (only while looking for them)'''
+        if self.record or not isinstance(callee, (ast.Variable, ast.GlobalVariable)): return None
+        fn = self.candidates.get(callee.name.lexeme)
+        return fn if id(fn) in self.number_calls else None
+
+    def visit_InlinedCall(self, expr: ast.InlinedCall):
+        self.visit(expr.call.callee)
+        arguments = [self.visit(arg) for arg in expr.call.arguments]
+        outer, self.arguments = self.arguments, arguments
+        self.visit(expr.expression)
+        self.arguments = outer
+        self.forget() # or it made the call
+        fn = self.candidate(expr.call.callee)
+        if fn is not None and any(t != NUMBER for t in arguments): self.number_calls[id(fn)] = False
+        return None
+
+    def visit_FunctionDefinition(self, fn: ast.FunctionDefinition):
+        # the body runs later, when nothing is known about the variables outside of it
+        state = self.known, self.pinned, self.breaks, self.arguments
+        self.body(fn.body, fn, numeric=False)
+        if id(fn) in self.numeric:
+            self.body(fn.number_body if self.record else fn.body, fn, numeric=True)
+        self.known, self.pinned, self.breaks, self.arguments = state
+        return FUNCTION
+
+    def body(self, body: ast.Block, fn: ast.FunctionDefinition, numeric: bool):
+        self.known, self.breaks, self.arguments = {}, [], None
+        params = [p.lexeme for p in fn.parameters]
+        if numeric:
+            self.known = {name: NUMBER for name in params}
+            self.pinned = frozenset(params) - assigned_names(body)
+        else: self.pinned = frozenset()
+        self.visit(body)
+
+    def visit_Range(self, r: ast.Range):
+        for x in (r.low, r.high, r.step): self.visit(x)
+        return LIST
+
+    def visit_ListLiteral(self, expr: ast.ListLiteral):
+        for e in expr.elements: self.visit(e)
+        return LIST
+
+    def visit_RecordLiteral(self, expr: ast.RecordLiteral):
+        for v in expr.values: self.visit(v)
+        return RECORD
+
+    def visit_Index(self, expr: ast.Index):
+        self.visit(expr.target)
+        self.visit(expr.index)
+        return None
+
+    def visit_FieldAccess(self, expr: ast.FieldAccess):
+        self.visit(expr.target)
+        return None
+
+
+def meet(a: dict, b: dict) -> dict:
+    '''What's known after either a or b'''
+    return {name: t for name, t in a.items() if b.get(name) == t}
+
+def jumps(branch) -> bool:
+    return isinstance(branch, ast.Block) and bool(branch.statements) \
+        and type(branch.statements[-1]) in (ast.BreakStatement, ast.ReturnStatement)
+
+def nodes(node):
+    '''Child nodes, without the definitions of InlinedCalls (which belong to the global functions)'''
+    for name, value in node.__dict__.items():
+        if name == 'definition' and isinstance(node, ast.InlinedCall): continue
+        if name == 'number_body': continue
+        if isinstance(value, list): yield from (v for v in value if isinstance(v, ast.AstNode))
+        elif isinstance(value, ast.AstNode): yield value
+
+def assigned_names(node) -> frozenset:
+    '''Names assigned anywhere in ``node``, including in nested functions'''
+    names = set()
+    def visit(node):
+        if isinstance(node, ast.AssignmentStatement): names.add(node.name.lexeme)
+        elif isinstance(node, ast.EachStatement) and node.var_name: names.add(node.var_name.lexeme)
+        for child in nodes(node): visit(child)
+    visit(node)
+    return frozenset(names)
+
+def copy_tree(node):
+    '''Copy of a syntax tree, sharing the tokens and the definitions of inlined functions'''
+    if isinstance(node, list): return [copy_tree(v) for v in node]
+    if not isinstance(node, ast.AstNode): return node
+    if isinstance(node, ast.InlinedCall):
+        return ast.InlinedCall(copy_tree(node.call), node.definition, copy_tree(node.expression))
+    return type(node)(**{f.name: copy_tree(getattr(node, f.name)) for f in dataclasses.fields(node)})
+
+replacements = {ast.Unary: ast.NumberUnary, ast.Binary: ast.NumberBinary, ast.AssignmentStatement: ast.NumberAssignment}
+
+def rewrite(node, proven: dict):
+    '''Replace the proven nodes under ``node`` (in place)'''
+    for name, value in list(node.__dict__.items()):
+        if name == 'definition' and isinstance(node, ast.InlinedCall): continue
+        if isinstance(value, list):
+            for i, child in enumerate(value):
+                if isinstance(child, ast.AstNode): value[i] = rewritten(child, proven)
+        elif isinstance(value, ast.AstNode):
+            setattr(node, name, rewritten(value, proven))
+
+def rewritten(node, proven: dict):
+    rewrite(node, proven)
+    if id(node) in proven:
+        return replacements[type(node)](**{f.name: getattr(node, f.name) for f in dataclasses.fields(node)})
+    return node
@@ -0,0 +1,41 @@
+'''Aggregates over a list with each-loops and with the native builtins, interpreted and with the
+   jit on. usage: python -m tools.aggregate_bench'''
+import time
+
+from src import scanner, parser, interpreter
+
+SETUP = '''
+xs = []
+each i of 1..100000 { push(xs, i / 7) }
+sq = x -> x*x
+'''
+
+CASES = {
+    'sum': ('s = 0\neach x of xs { s += x }', 's = sum(xs)'),
+    'max': ('s = xs[0]\neach x of xs { if x > s { s = x } }', 's = max(xs)'),
+    'sum of squares': ('s = 0\neach x of xs { s += sq(x) }', 's = sum(map(sq, xs))'),
+}
+
+def bench(source, jit_threshold, repeat=3):
+    setup = parser.Parser().parse(scanner.Scanner(SETUP).scan_tokens())
+    statements = parser.Parser().parse(scanner.Scanner(source).scan_tokens())
+    best = float('inf')
+    for _ in range(repeat):
+        interp = interpreter.Interpreter(jit_threshold=jit_threshold)
+        interp.interpret(setup)
+        t0 = time.perf_counter()
+        interp.interpret(statements)
+        best = min(best, time.perf_counter() - t0)
+    return best, interp.global_scope.dict['s']
+
+def main():
+    for jit_threshold in (None, 100):
+        print(f"jit_threshold={jit_threshold}")
+        for name, (loop, native) in CASES.items():
+            looped, expected = bench(loop, jit_threshold)
+            builtin, result = bench(native, jit_threshold)
+            assert abs(result - expected) <= 1e-9 * abs(expected), (result, expected)
+            print(f"  {name:15} each-loop {looped:.3f}s, builtin {builtin:.4f}s, speedup {looped / builtin:.0f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+'''Evaluates g = x,y -> 2x^2+y from tests/functions.nath over columns, vectorized vs one call
+   per row. usage: python -m tools.batch_bench [rows]'''
+import sys, time
+
+import numpy as np
+
+from src import batch
+
+SOURCE = "x, y -> 2x^2 + y"
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(0)
+    columns = {'x': rng.random(rows), 'y': rng.random(rows)}
+
+    t0 = time.perf_counter()
+    vectorized = batch.evaluate_columns(SOURCE, columns)
+    t1 = time.perf_counter()
+    # force the per row path, both in this process and on the process pool
+    batch.Vectorizer, vectorizer = NoVectorizer, batch.Vectorizer
+    try:
+        serial = batch.evaluate_columns(SOURCE, columns, processes=0)
+        t2 = time.perf_counter()
+        pooled = batch.evaluate_columns(SOURCE, columns)
+        t3 = time.perf_counter()
+    finally: batch.Vectorizer = vectorizer
+
+    assert np.allclose(vectorized, serial) and np.allclose(vectorized, pooled)
+    print(f"{rows} rows: vectorized {t1-t0:.3f}s, per row {t2-t1:.3f}s, "
+          f"per row on a process pool {t3-t2:.3f}s, speedup {(t2-t1) / (t1-t0):.0f}x")
+
+class NoVectorizer():
+    def __init__(self, fn): raise batch.CannotVectorize()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''Measures the overhead of checking a Budget, with the limits set high enough to never trigger.
+   usage: python -m tools.budget_bench'''
+import time
+
+from src import scanner, parser, interpreter
+from src.budget import Budget
+
+SOURCE = '''
+fib = x -> {
+    if x <= 1 {return 1}
+    a = fib(x-2)
+    b = fib(x-1)
+    return a + b
+}
+total = 0
+each i of 0..30000 {
+    j = 0
+    while j < 3 { j += 1 }
+    total += i
+}
+fib(18)
+'''
+
+def bench(budget, jit_threshold, repeat=5):
+    statements = parser.Parser().parse(scanner.Scanner(SOURCE).scan_tokens())
+    best = float('inf')
+    for _ in range(repeat):
+        interp = interpreter.Interpreter(jit_threshold=jit_threshold, budget=budget)
+        t0 = time.perf_counter()
+        interp.interpret(statements)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    limits = dict(max_steps=10**12, timeout=3600, max_call_depth=10**6, max_sequence_length=10**9)
+    for jit_threshold, label in [(None, 'interpreted'), (100, 'jit')]:
+        without = bench(None, jit_threshold)
+        with_budget = bench(Budget(**limits), jit_threshold)
+        print(f"{label}: no budget {without:.3f}s, budget {with_budget:.3f}s, "
+              f"overhead {100 * (with_budget / without - 1):+.1f}%")
+
+if __name__ == '__main__':
+    main()
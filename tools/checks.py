@@ -0,0 +1,265 @@
+'''Checks of the embedding api and the runtime that the .nath scripts in tests/ can't do, each one
+   fails with an AssertionError. usage: python -m tools.checks [names of checks]'''
+import sys, io, os, asyncio, threading, tempfile
+
+import nath
+from src import tasks, interpreter, parallel_parser
+import src.ast_nodes as ast
+from src.notebook import Notebook
+from src.objects import NathFunction
+from src.tokens import Token
+
+def error_of(program, **run_options) -> tuple:
+    '''(line, message) of the NathRuntimeError that running ``program`` raises'''
+    try: program.run(**run_options)
+    except nath.NathRuntimeError as e:
+        return e.where.line_num if isinstance(e.where, Token) else e.where, e.msg
+    raise AssertionError("ran without an error")
+
+BUDGET_CASES = [ # source, limits, line and message of the error
+    ("x = 1\nwhile true { x += 1 }", {'max_steps': 1000}, 2, "Exceeded the budget of 1000 steps"),
+    ("x = 0\n\nwhile true { x += 1 }", {'timeout': 0.2}, 3, "Exceeded the time budget of 0.2s"),
+    ("f = n -> f(n + 1)\ny = f(0)", {'max_call_depth': 50}, 1, "Exceeded the maximum call depth of 50"),
+    ("\nxs = 0..10^6", {'max_sequence_length': 1000}, 2, "Sequence of length 1000001 exceeds the budget of 1000"),
+    ('s = "ab"\neach i of 1..20 { s = s + s }', {'max_sequence_length': 1000}, 2,
+     "Sequence of length 1024 exceeds the budget of 1000"),
+    ("xs = []\n\nwhile true { push(xs, 1) }", {'max_sequence_length': 10}, 3,
+     "Sequence of length 11 exceeds the budget of 10"),
+    ("x = 2\ny = x ^ (10^7)", {}, 2, "Integer of about 20000000 bits exceeds the budget of 1000000 bits"),
+    ("x = 10^6\ny = 1\ny = x!", {}, 3, "Integer of about 20000000 bits exceeds the budget of 1000000 bits"),
+    # in functions that get compiled
+    ("f = n -> {\n    s = 0\n    each i of 1..n { s += i }\n    return s\n}\neach k of 1..100 { t = f(k) }",
+     {'max_steps': 2000}, 3, "Exceeded the budget of 2000 steps"),
+    ("g = n -> {\n    xs = []\n    while len(xs) < n { push(xs, 0) }\n    return xs\n}\neach k of 1..5 { t = g(5k) }",
+     {'max_sequence_length': 20}, 3, "Sequence of length 21 exceeds the budget of 20"),
+    ("h = n -> n ^ n\neach k of 1..200 { t = h(k) }\nt = h(10^6)", {}, 1,
+     "Integer of about 20000000 bits exceeds the budget of 1000000 bits"),
+]
+
+def check_budget():
+    # every limit raises at the line that exceeded it, interpreted and jit compiled
+    for source, limits, line, message in BUDGET_CASES:
+        program = nath.compile(source)
+        for jit_threshold in (None, 1):
+            error = error_of(program, budget=nath.Budget(**limits), jit_threshold=jit_threshold)
+            assert error == (line, message), (source, jit_threshold, error)
+    # and scripts within the limits run as without a budget
+    program = nath.compile("f = n -> n * n\ntotal = 0\neach i of 1..100 { total += f(i) }")
+    limits = {'max_steps': 1000, 'timeout': 5, 'max_call_depth': 10, 'max_sequence_length': 100}
+    assert program.run(budget=nath.Budget(**limits)).bindings['total'] == program.run().bindings['total']
+
+def check_program():
+    # a compiled program runs many times, each run in a fresh global scope with its own bindings
+    program = nath.compile("y = 2x^2 + 1\nprint y\nys = xs\npush(ys, y)")
+    xs = [1, 2]
+    first = program.run(bindings={'x': 3, 'xs': xs}, capture_output=True)
+    assert first.output == "19\n", first.output
+    assert set(first.bindings) == {'x', 'xs', 'y', 'ys'}, first.bindings # no builtins
+    assert first.bindings['y'] == 19 and str(first.bindings['ys']) == "[1, 2, 19]"
+    assert xs == [1, 2] # python lists are copied into the script
+    second = program.run(bindings={'x': 1.5, 'xs': range(3)}, capture_output=True)
+    assert second.output == "5.5\n" and str(second.bindings['ys']) == "[0, 1, 2, 5.5]"
+    assert error_of(program, bindings={'xs': []}) == (1, "Undefined variable 'x'") # nothing left from the runs before
+    # the builtins are shared, a script that redefines one only changes its own global
+    redefines = nath.compile("len = s -> 0\nn = len([1, 2])")
+    result = redefines.run()
+    assert result.bindings['n'] == 0 and result.output is None # printed to stdout, if anything
+    assert program.run(bindings={'x': 0, 'xs': []}, capture_output=True).bindings['y'] == 1
+    assert nath.compile("n = len([1, 2])").run().bindings['n'] == 2
+
+BATCH_CASES = [ # functions, and whether they have a numpy equivalent
+    ("x, y -> 2x^2 + y", True),
+    ("x, y -> sqrt(x + 2) + log(y + 1) - exp(-x)", True),
+    ("x, y -> sqrt(x) + y", False), # sqrt(-1.5) raises in the interpreter
+    ("x, y -> x > y", True),
+    ("x, y -> -x / (y + 0.5) + sin(x) * cos(y)", True),
+    ("x, y -> x ^ y", False), # (-1.5)^0.5 and 2^1000 aren't floats
+    ("x, y -> len(\"ab\") * x + y", False), # no numpy equivalent
+]
+
+def check_batch():
+    # evaluating over whole columns gives what calling the function for every row does
+    if not hasattr(nath, 'evaluate_columns'): return # numpy isnt installed
+    from src.batch import load_function, Vectorizer, CannotVectorize
+    import numpy as np
+    xs = np.array([-1.5, 0, 0.5, 2, 3])
+    ys = np.array([0.5, 1, 2, 1000, -0.25])
+    for source, vectorized in BATCH_CASES:
+        fn = load_function(source)
+        rows = []
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            try: rows.append(fn.interpreter.do_call(fn, [x, y]))
+            except nath.NathRuntimeError as e: rows.append(e.msg)
+        try:
+            Vectorizer(fn).evaluate({'x': xs, 'y': ys})
+            assert vectorized, source
+        except CannotVectorize: assert not vectorized, source
+        if any(isinstance(r, str) for r in rows): # the interpreter raises, so does the batch
+            try: nath.evaluate_columns(source, {'x': xs, 'y': ys}, processes=0)
+            except nath.NathRuntimeError as e: assert e.msg in rows, (source, e.msg)
+            else: raise AssertionError(f"{source} didn't raise")
+        else:
+            result = nath.evaluate_columns(source, {'x': xs, 'y': ys}, processes=0)
+            assert result.tolist() == rows, (source, result.tolist(), rows)
+    # bools aren't numbers in the interpreter, so they dont vectorize either
+    fn = load_function("x -> (x > 1) + 1")
+    try: Vectorizer(fn).evaluate({'x': xs})
+    except CannotVectorize: pass
+    else: raise AssertionError("vectorized an operation on bools")
+
+NOTEBOOK_EDITS = [ # versions of a script, and the lines that run after changing to each one
+    ("a = 1\nb = a + 1\nc = 10\nf = x -> x + c\nd = f(b)\nprint d\nxs = [1]\npush(xs, a)\nn = len(xs)\ntotal = 0\ntotal += n",
+     [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]),
+    ("a = 1\nb = a + 1\nc = 10\nf = x -> x + c\nd = f(b)\nprint d\nxs = [1]\npush(xs, a)\nn = len(xs)\ntotal = 0\ntotal += n",
+     []), # unchanged
+    ("a = 1\nb = a + 1\nc = 20\nf = x -> x + c\nd = f(b)\nprint d\nxs = [1]\npush(xs, a)\nn = len(xs)\ntotal = 0\ntotal += n",
+     [3, 4, 5, 6]), # f reads c, so the call of f runs again
+    ("a = 2\nb = a + 1\nc = 20\nf = x -> x + c\nd = f(b)\nprint d\nxs = [1]\npush(xs, a)\nn = len(xs)\ntotal = 0\ntotal += n",
+     [1, 2, 5, 6, 7, 8, 9, 10, 11]), # push updates xs in place, so xs = [1] runs again first
+    ("a = 2\nb = a + 1\nc = 20\nf = x -> x * c\nd = f(b)\nxs = [1]\npush(xs, a)\nn = len(xs)\ntotal = 0\ntotal += n",
+     [4, 5]), # removing the print doesn't run anything
+    ("a = 2\nb = a + 1\nd = 0\nxs = [1]\npush(xs, a)\nn = len(xs)\ntotal = 0\ntotal += n", [3]),
+]
+
+def check_notebook():
+    # after every edit, only the changed statements and their dependents run, and the globals are
+    # the ones a fresh run of the script makes
+    output = io.StringIO()
+    notebook = Notebook(output=output)
+    for source, lines in NOTEBOOK_EDITS:
+        ran = notebook.update(source)
+        assert ran == lines, (source, ran)
+        fresh = nath.compile(source).run(capture_output=True).bindings
+        values = {name: value for name, value in notebook.interpreter.global_scope.dict.items()
+                  if interpreter.BUILTINS.get(name) is not value}
+        assert set(values) == set(fresh), (set(values), set(fresh))
+        assert all(str(values[name]) == str(fresh[name]) for name in fresh if not isinstance(fresh[name], NathFunction))
+    assert output.getvalue() == "12\n22\n23\n"
+
+PARSE_CHUNK = '''
+f{i} = x -> {
+    if x > {i} { return x }
+    else { return "}" + "{ # not a comment" }
+}
+# a comment with ( and {
+s{i} = "a string over
+two lines with ) in it"
+g{i} = a, b -> (a * b) + f{i}(a)
+each k of 1..3 { push(xs, f{i}(k)) }
+'''
+
+def tree(node):
+    '''Comparable form of a syntax tree, with the line numbers of its tokens'''
+    if isinstance(node, Token): return (node.type, node.lexeme, node.literal, node.line_num)
+    if isinstance(node, ast.AstNode): return (type(node).__name__,) + tuple(tree(v) for v in node.__dict__.values())
+    if isinstance(node, (list, tuple)): return tuple(tree(v) for v in node)
+    return node
+
+def parse_result(source, processes):
+    try: return tree(parallel_parser.parse(source, processes))
+    except nath.NathSyntaxError as e: return (e.where.line_num if isinstance(e.where, Token) else e.where, e.msg)
+
+def check_parallel_parse():
+    # parsing in pieces on a process pool gives the same statements, line numbers and errors
+    source = "xs = []\n" + "".join(PARSE_CHUNK.replace("{i}", str(i)) for i in range(300))
+    lines = source.count("\n")
+    broken = [ # a parse error at the end, a scan error after a parse error (scanning comes first)
+        source + "y = (1 +\n",
+        source[:len(source) // 4] + "z = 1 +\n" + source[len(source) // 4:] + "w = 1 ~ 2\n",
+    ]
+    threshold, parallel_parser.PARALLEL_THRESHOLD = parallel_parser.PARALLEL_THRESHOLD, 0
+    try:
+        assert len(parallel_parser.split(source, 8)) == 8
+        serial = parse_result(source, 1)
+        assert serial == parse_result(source, 2)
+        assert len(serial) == 1 + 300 * 4 and serial[-1][0][-1][-1] == lines # 'each' on the last line
+        for source in broken:
+            error = parse_result(source, 1)
+            assert type(error[1]) is str and error == parse_result(source, 2), (error, parse_result(source, 2))
+    finally: parallel_parser.PARALLEL_THRESHOLD = threshold
+
+SNAPSHOT_SETUP = '''
+print "setup ran"
+make = () -> {
+    n = 0
+    inc = () -> {
+        n += 1
+        return n
+    }
+    get = () -> n
+    return [inc, get]
+}
+pair = make()
+inc = pair[0]
+get = pair[1]
+table = [1, 2, 3]
+alias = table
+point = {x: 1, y: 2}
+'''
+SNAPSHOT_PROGRAM = "a = inc()\nb = inc()\nc = get()\npush(alias, 4)\nm = len(table)\npoint.y += 1\nd = point.y"
+
+def check_snapshot():
+    # a restored setup behaves like one that ran: closures still share their cells, globals
+    # still share their values
+    setup, program = nath.compile(SNAPSHOT_SETUP), nath.compile(SNAPSHOT_PROGRAM)
+    expected = {'a': 1, 'b': 2, 'c': 2, 'm': 4, 'd': 3}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "setup.snapshot")
+        for run, jit_threshold in enumerate([None, 1, None, 1]): # the first run saves the snapshot
+            result = program.run(setup=setup, snapshot_path=path, capture_output=True, jit_threshold=jit_threshold)
+            assert {name: result.bindings[name] for name in expected} == expected, result.bindings
+            assert result.output == ("setup ran\n" if run == 0 else ""), result.output
+        # another setup source, or a broken file, runs the setup again
+        other = nath.compile(SNAPSHOT_SETUP + "extra = 1\n")
+        assert program.run(setup=other, snapshot_path=path, capture_output=True).output == "setup ran\n"
+        with open(path, 'r+b') as f: f.truncate(os.path.getsize(path) // 2)
+        assert program.run(setup=setup, snapshot_path=path, capture_output=True).output == "setup ran\n"
+        assert program.run(setup=setup, snapshot_path=path, capture_output=True).output == ""
+
+def check_task_threads():
+    # waiting tasks keep a thread each, at most tasks.MAX_THREADS of them, and tasks that await
+    # tasks still waiting for a thread don't deadlock
+    source = '''
+child = i -> {
+    sleep(0.01)
+    return i
+}
+parent = i -> {
+    sleep(0.01)
+    return await spawn child(i) + 1
+}
+handles = []
+each i of 1..n { push(handles, spawn parent(i)) }
+total = 0
+each h of handles { total += await h }
+'''
+    program = nath.compile(source)
+    limit, tasks.MAX_THREADS = tasks.MAX_THREADS, 8
+    peak = threading.active_count()
+    async def sample():
+        nonlocal peak
+        while True:
+            peak = max(peak, threading.active_count())
+            await asyncio.sleep(0.001)
+    async def main():
+        sampler = asyncio.ensure_future(sample())
+        runs = await asyncio.gather(*(program.run_async(bindings={'n': 20}) for _ in range(30)))
+        sampler.cancel()
+        return runs, tasks.threads_of(asyncio.get_running_loop()).peak
+    try:
+        before = threading.active_count()
+        runs, threads = asyncio.run(main())
+    finally: tasks.MAX_THREADS = limit
+    assert all(r.bindings['total'] == 20 * 21 // 2 + 20 for r in runs)
+    assert threads == 8, threads
+    assert peak - before <= 8, peak - before
+
+CHECKS = {name[len('check_'):]: f for name, f in list(globals().items()) if name.startswith('check_')}
+
+def main(names):
+    for name in names or CHECKS:
+        CHECKS[name]()
+        print(f"{name}: ok")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,37 @@
+'''Measures the memory retained by closures returned from a make_counter style function.
+   usage: python -m tools.closure_memory [n_closures]'''
+import sys, time, tracemalloc
+
+from src import scanner, parser, interpreter
+
+SOURCE = '''
+make_counter = () -> {
+    i = 0
+    table = 0..100
+    scratch = "some local string that the counter doesnt need"
+    count = () -> {
+        i += 1
+        return i
+    }
+    return count
+}
+'''
+
+def main(n):
+    interp = interpreter.Interpreter()
+    interp.interpret(parser.Parser().parse(scanner.Scanner(SOURCE).scan_tokens()))
+    make_counter = interp.global_scope.dict['make_counter']
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    closures = [make_counter.call() for _ in range(n)]
+    elapsed = time.perf_counter() - t0
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert closures[0].call() == 1 and closures[0].call() == 2 and closures[-1].call() == 1
+    print(f"{n} closures: {retained / 2**20:.1f} MiB retained, "
+          f"{retained / n:.0f} bytes/closure, created in {elapsed:.2f}s")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
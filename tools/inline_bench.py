@@ -0,0 +1,33 @@
+'''Calls of one-line functions with and without the inliner, interpreted (the jit compiles the
+   loop otherwise). usage: python -m tools.inline_bench'''
+import time
+
+from src import scanner, parser, interpreter
+from src.inliner import Inliner
+
+SOURCE = '''
+f = (x -> 2x+1)
+g = x -> x^2
+s = 0
+each i of 1..100000 { s += g(f(i)) }
+'''
+
+def bench(inline, repeat=3):
+    statements = parser.Parser().parse(scanner.Scanner(SOURCE).scan_tokens())
+    if inline: Inliner().inline(statements)
+    best = float('inf')
+    for _ in range(repeat):
+        interp = interpreter.Interpreter(jit_threshold=None)
+        t0 = time.perf_counter()
+        interp.interpret(statements)
+        best = min(best, time.perf_counter() - t0)
+    return best, interp.global_scope.dict['s']
+
+def main():
+    called, expected = bench(inline=False)
+    inlined, result = bench(inline=True)
+    assert result == expected
+    print(f"200000 calls: called {called:.2f}s, inlined {inlined:.2f}s, speedup {called / inlined:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+'''Compares the tree-walking interpreter with jit compiled functions on fib and factorial 
+   from tests/functions.nath. usage: python -m tools.jit_bench'''
+import time
+
+from src import scanner, parser, interpreter
+
+SOURCE = '''
+factorial = x -> {
+    if x == 0 {return 1}
+    else { return x * factorial(x-1) }
+}
+fib = x -> {
+    if x <= 1 {return 1}
+    a = fib(x-2)
+    b = fib(x-1)
+    return a + b
+}
+'''
+CASES = [('fib', (22,), 1), ('factorial', (20,), 5000)]
+
+def bench(jit_threshold, name, args, repeat):
+    interp = interpreter.Interpreter(jit_threshold=jit_threshold)
+    interp.interpret(parser.Parser().parse(scanner.Scanner(SOURCE).scan_tokens()))
+    fn = interp.global_scope.dict[name]
+    t0 = time.perf_counter()
+    for _ in range(repeat): result = fn.call(*args)
+    return time.perf_counter() - t0, result
+
+def main():
+    for name, args, repeat in CASES:
+        interpreted, expected = bench(None, name, args, repeat)
+        compiled, result = bench(100, name, args, repeat)
+        assert result == expected
+        print(f"{name}{args} x{repeat}: interpreted {interpreted:.3f}s, jit {compiled:.3f}s, "
+              f"speedup {interpreted / compiled:.1f}x")
+
+if __name__ == '__main__':
+    main()
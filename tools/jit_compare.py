@@ -0,0 +1,29 @@
+'''Runs scripts with the jit at a few thresholds and without it, and checks that they print the
+   same and fail with the same error. usage: python -m tools.jit_compare [paths] (tests/jit.nath
+   by default)'''
+import sys
+
+import nath
+
+THRESHOLDS = [100, 1] # the default, and compiling every function on its second call
+
+def run(program, jit_threshold) -> str:
+    try: return program.run(capture_output=True, jit_threshold=jit_threshold).output
+    except nath.NathRuntimeError as e: return f"error: {e}"
+
+def main(paths):
+    failed = False
+    for path in paths:
+        with open(path) as f: program = nath.compile(f.read())
+        interpreted = run(program, None)
+        compiled = {t: run(program, t) for t in THRESHOLDS}
+        differs = [t for t in THRESHOLDS if compiled[t] != interpreted]
+        for threshold in differs:
+            print(f"{path}: jit_threshold={threshold} differs from the interpreter")
+            print(f"  interpreted: {interpreted!r}\n  compiled:    {compiled[threshold]!r}")
+        if not differs: print(f"{path}: same output with and without the jit")
+        failed = failed or bool(differs)
+    if failed: sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['tests/jit.nath'])
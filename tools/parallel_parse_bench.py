@@ -0,0 +1,37 @@
+'''Serial vs parallel scanning and parsing of a big generated script, for 1, 2, 4, ... processes
+   up to the number of cores. usage: python -m tools.parallel_parse_bench [statements] [max processes]'''
+import os, sys, time
+
+from src import scanner, parser, parallel_parser
+from src.notebook import statement_key
+
+# like the output of a code generator: independent assignments and function definitions
+CHUNK = '''c{i} = {i} * 2.5 + 3
+f{i} = (x, y) -> {{
+    if x > y {{ return x - c{i} }}
+    else {{ return [x, y, "s{i}"] }}
+}}
+'''
+
+def timed(parse):
+    t0 = time.perf_counter()
+    statements = parse()
+    return time.perf_counter() - t0, statements
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    max_processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    source = ''.join(CHUNK.format(i=i) for i in range(n // 2))
+    serial, expected = timed(lambda: parser.Parser().parse(scanner.Scanner(source).scan_tokens()))
+    print(f"{len(expected)} statements, {len(source) / 1e6:.1f}MB, {os.cpu_count()} cores: serial {serial:.2f}s")
+    expected = [(statement_key(stmt), num) for stmt, num in expected]
+
+    processes = 1
+    while processes <= max_processes:
+        elapsed, statements = timed(lambda: parallel_parser.parse(source, processes))
+        assert [(statement_key(stmt), num) for stmt, num in statements] == expected
+        print(f"{processes} processes: {elapsed:.2f}s, speedup {serial / elapsed:.2f}x")
+        processes *= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+'''Parse throughput on a large generated script. usage: python -m tools.parse_bench [statements]'''
+import sys, time
+
+from src import scanner, parser
+
+# a mix of the statements in tests/, ~1 statement per line
+CHUNK = '''
+f{i} = x, y -> 2x^2 + 3y - (x - y) / 4
+g{i} = (n) -> {{
+    total = 0
+    each k of 1..n..2 {{ total += k! * f{i}(k, -k) }}
+    if not total <= 100 and n != 3 {{ return total }} elseif n < 0 {{ return -1 }}
+    else {{ return [total, n, "done"][0] }}
+}}
+xs{i} = [1, 2.5, 3x, sin(x)^2 + cos(x)^2]
+xs{i}[1] *= g{i}(10) + len(xs{i}[0..2])
+while a{i} <= 10 or b >= 2 {{ a{i} += 1; break }}
+print f{i}(1, 2) == 3 != false
+'''
+STATEMENTS_PER_CHUNK = 6 # top level
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 60_000
+    source = ''.join(CHUNK.format(i=i) for i in range(n // STATEMENTS_PER_CHUNK))
+    tokens = scanner.Scanner(source).scan_tokens()
+    t0 = time.perf_counter()
+    statements = parser.Parser().parse(tokens)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(statements)} statements, {len(tokens)} tokens: parsed in {elapsed:.2f}s, "
+          f"{len(statements) / elapsed:,.0f} statements/s, {len(tokens) / elapsed:,.0f} tokens/s")
+
+if __name__ == '__main__':
+    main()
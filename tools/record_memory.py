@@ -0,0 +1,58 @@
+'''Memory per record for records, and for the closures scripts used to fake them with, and the time
+   of field reads when the inline cache hits and misses. usage: python -m tools.record_memory [n_records]'''
+import sys, time, tracemalloc
+
+from src import scanner, parser, interpreter
+from src.tokens import Token, TokenType as tt
+import src.ast_nodes as ast
+
+SOURCE = '''
+make_record = (a, b, c) -> ({x: a, y: b, z: c})
+make_closure = (a, b, c) -> {
+    get = name -> {
+        if name == "x" { return a }
+        if name == "y" { return b }
+        return c
+    }
+    return get
+}
+'''
+
+def retained(f, n):
+    tracemalloc.start()
+    values = [f(i, 2.5, 3) for i in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return values, size / n
+
+def read_time(interp, points, n=1_000_000):
+    '''Seconds for n reads of p.y, with p alternating between ``points``'''
+    p = Token(tt.IDENTIFIER, 'p', 'p', 1)
+    field = ast.FieldAccess(ast.Variable(p), Token(tt.IDENTIFIER, 'y', 'y', 1))
+    t0 = time.perf_counter()
+    for i in range(n):
+        interp.global_scope.dict['p'] = points[i & 1]
+        interp.evaluate(field)
+    return time.perf_counter() - t0
+
+def main(n):
+    interp = interpreter.Interpreter()
+    interp.interpret(parser.Parser().parse(scanner.Scanner(SOURCE).scan_tokens()))
+    make_record = interp.global_scope.dict['make_record']
+    make_closure = interp.global_scope.dict['make_closure']
+
+    records, per_record = retained(make_record.call, n)
+    closures, per_closure = retained(make_closure.call, n)
+    dicts, per_dict = retained(lambda a, b, c: {'x': a, 'y': b, 'z': c}, n)
+    assert len({id(r.shape) for r in records}) == 1 and closures[5].call("x") == records[5].values[0]
+    print(f"3 fields: record {per_record:.0f} bytes, closure {per_closure:.0f} bytes, "
+          f"(python dict {per_dict:.0f} bytes)")
+
+    same_shape = read_time(interp, records[:2])
+    other = make_record.call(1, 2.5, 3)
+    other.add_field('w', None) # same offset for y, but another shape
+    alternating = read_time(interp, [records[0], other])
+    print(f"1M reads of p.y: inline cache hits {same_shape:.2f}s, alternating shapes (misses) {alternating:.2f}s")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,54 @@
+'''Restoring the globals of a setup script from a snapshot against running it again.
+   usage: python -m tools.snapshot_bench'''
+import os, time, tempfile
+
+import nath
+from src import snapshot, interpreter
+
+SETUP = '''
+squares = []
+each i of 0..200000 { push(squares, i^2) }
+sieve = []
+each i of 0..100000 { push(sieve, true) }
+each p of 2..316 {
+    if sieve[p] { each m of p*p..100000..p { sieve[m] = false } }
+}
+primes = []
+each n of 2..100000 { if sieve[n] { push(primes, n) } }
+'''
+SETUP += ''.join(f'''
+make_{i} = k -> {{
+    offset = k * {i}
+    return x -> x + offset + squares[{i}]
+}}
+f_{i} = make_{i}({i})
+''' for i in range(200))
+
+def best_of(f, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    setup = nath.compile(SETUP)
+    path = os.path.join(tempfile.mkdtemp(), 'setup.snapshot')
+    expected = nath.compile('done = true').run(setup=setup).bindings
+
+    executed = best_of(lambda: interpreter.Interpreter().interpret(setup.statements), repeat=1)
+    interp = interpreter.Interpreter()
+    interp.interpret(setup.statements)
+    saved = best_of(lambda: snapshot.save(interp, path, setup.source))
+    restored = best_of(lambda: snapshot.restore(interpreter.Interpreter(), path, setup.source))
+
+    bindings = nath.compile('done = true').run(setup=setup, snapshot_path=path).bindings
+    assert bindings['squares'] == expected['squares'] and bindings['primes'] == expected['primes']
+    assert bindings['f_7'].call(1) == expected['f_7'].call(1)
+    print(f"{len(bindings)} globals, {len(expected['primes'])} primes, snapshot {os.path.getsize(path) / 1e6:.2f}MB")
+    print(f"run setup {executed:.3f}s, save {saved:.3f}s, restore {restored:.4f}s, "
+          f"speedup {executed / restored:.0f}x")
+
+if __name__ == '__main__':
+    main()
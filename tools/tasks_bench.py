@@ -0,0 +1,46 @@
+'''Many scripts that mostly wait, run concurrently on one event loop with Program.run_async, and
+   one script that spawns many waiting tasks. usage: python -m tools.tasks_bench [n_scripts]'''
+import sys, time, asyncio, threading
+
+import nath
+
+SCRIPT = '''
+total = 0
+each i of 1..5 {
+    sleep(0.05)
+    total += i * k
+}
+'''
+
+SPAWNER = '''
+wait = i -> {
+    sleep(0.2)
+    return i
+}
+handles = []
+each i of 1..n { push(handles, spawn wait(i)) }
+total = 0
+each h of handles { total += await h }
+'''
+
+async def run_all(program, n):
+    return await asyncio.gather(*(program.run_async(bindings={'k': k}) for k in range(n)))
+
+def main(n):
+    program = nath.compile(SCRIPT)
+    t0 = time.perf_counter()
+    results = asyncio.run(run_all(program, n))
+    concurrent = time.perf_counter() - t0
+    assert [r.bindings['total'] for r in results] == [15 * k for k in range(n)]
+    print(f"{n} scripts that each sleep 5 x 0.05s: {concurrent:.2f}s concurrently, "
+          f"{n * 0.25:.0f}s one after the other")
+
+    threads = threading.active_count()
+    t0 = time.perf_counter()
+    result = asyncio.run(nath.compile(SPAWNER).run_async(bindings={'n': n}))
+    spawned = time.perf_counter() - t0
+    assert result.bindings['total'] == n * (n + 1) // 2 and threading.active_count() == threads
+    print(f"{n} spawned tasks that each sleep 0.2s: {spawned:.2f}s")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,58 @@
+'''Runs one shared Program from many threads at once and checks every run against a serial run.
+   usage: python -m tools.thread_stress [n_threads] [runs_per_thread]'''
+import sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+import nath
+
+SOURCE = '''
+make_counter = () -> {
+    i = 0
+    count = () -> {
+        i += 1
+        return i
+    }
+    return count
+}
+fib = x -> {
+    if x <= 1 {return 1}
+    a = fib(x-2)
+    b = fib(x-1)
+    return a + b
+}
+counter = make_counter()
+squares = []
+each k of 0..n {
+    push(squares, k^2 + seed)
+    counter()
+}
+each x of squares[0..2] { print x }
+print fib(n) + counter()
+label = "run " + name
+print label
+'''
+
+def run(program, seed, jit_threshold):
+    bindings = {'n': 10 + seed % 7, 'seed': seed, 'name': str(seed)}
+    result = program.run(bindings=bindings, capture_output=True, jit_threshold=jit_threshold)
+    return result.output, str(result.bindings['squares']), result.bindings['label']
+
+def main(n_threads, runs_per_thread):
+    program = nath.compile(SOURCE)
+    seeds = list(range(n_threads * runs_per_thread))
+    # reference results without the jit, run serially on a separate copy of the program
+    reference = nath.compile(SOURCE)
+    expected = {seed: run(reference, seed, None) for seed in set(s % 50 for s in seeds)}
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        results = list(pool.map(lambda seed: (seed, run(program, seed % 50, 5)), seeds))
+    elapsed = time.perf_counter() - t0
+
+    failures = [seed for seed, result in results if result != expected[seed % 50]]
+    print(f"{len(results)} runs on {n_threads} threads in {elapsed:.2f}s, {len(failures)} mismatches")
+    if failures: sys.exit(1)
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [16, 50][len(args):]))
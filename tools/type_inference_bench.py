@@ -0,0 +1,73 @@
+'''Number heavy scripts with and without the operand type checks that the type inference proves
+   unnecessary, interpreted and with the jit on. usage: python -m tools.type_inference_bench'''
+import time
+
+from src import scanner, parser, interpreter
+from src.inliner import Inliner
+from src.resolver import FreeVariables
+from src.type_inference import TypeInference
+
+CASES = {
+    'loop': '''
+s = 0
+each i of 0..100000 { s += i * i - 3i / 2 }
+''',
+    'while': '''
+s = 0
+i = 0
+while i < 100000 {
+    s += i ^ 2
+    i += 1
+}
+''',
+    'fib': '''
+fib = n -> {
+    if n < 2 { return n }
+    return fib(n - 1) + fib(n - 2)
+}
+s = fib(21)
+''',
+    'collatz': '''
+steps = n -> {
+    count = 0
+    while n > 1 {
+        half = n / 2
+        if half == n / 2 and half * 2 == n { n = half } else { n = 3n + 1 }
+        count += 1
+    }
+    return count
+}
+s = 0
+each i of 1..3000 { s += steps(i) }
+''',
+}
+
+def prepare(source, infer: bool):
+    statements = parser.Parser().parse(scanner.Scanner(source).scan_tokens())
+    Inliner().inline(statements)
+    removed = TypeInference().infer(statements) if infer else 0
+    FreeVariables().resolve(statements)
+    return statements, removed
+
+def bench(source, infer: bool, jit_threshold, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        statements, removed = prepare(source, infer) # the jit caches its translation on the tree
+        interp = interpreter.Interpreter(jit_threshold=jit_threshold)
+        t0 = time.perf_counter()
+        interp.interpret(statements)
+        best = min(best, time.perf_counter() - t0)
+    return best, interp.global_scope.dict['s'], removed
+
+def main():
+    for jit_threshold in (None, 100):
+        print(f"jit_threshold={jit_threshold}")
+        for name, source in CASES.items():
+            checked, expected, _ = bench(source, False, jit_threshold)
+            proven, result, removed = bench(source, True, jit_threshold)
+            assert result == expected, (result, expected)
+            print(f"  {name:8} {removed:2} checks removed, checked {checked:.3f}s, proven {proven:.3f}s, "
+                  f"speedup {checked / proven:.2f}x")
+
+if __name__ == '__main__':
+    main()